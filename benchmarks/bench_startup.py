@@ -0,0 +1,103 @@
+"""
+Benchmark of start up time: how long the modules take to import, and how long a run stopped by --precheck takes
+end to end, against local stand-in servers.
+
+Run from the repository root, e.g.
+    python -m benchmarks.bench_startup --runs 10
+"""
+from __future__ import annotations
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from benchmarks.bench_sync import parse_args as parse_sync_args, run_sync, write_configs
+from benchmarks.mock_servers import MockCanvasServer, MockNotionServer
+
+MODULES = ("main", "src.canvas", "src.notion", "src.precheck", "requests", "selenium.webdriver", "dotenv")
+
+PRECHECK_SCRIPT = """
+import sys
+from src.precheck import SyncPrecheck
+sys.exit(3 if SyncPrecheck(sys.argv[1], sys.argv[2]).has_changes() else 0)
+"""
+
+
+def import_time(module: str) -> float:
+    """
+    :param module: The name of the module to import
+    :return: The cumulative import time of the module in seconds, as reported by python -X importtime in a fresh
+    interpreter
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, check=True)
+    pattern = re.compile(rf"^import time:\s+\d+ \|\s+(\d+) \| {re.escape(module)}$")
+    for line in result.stderr.splitlines():
+        if match := pattern.match(line):
+            return int(match.group(1)) / 1e6
+    return 0.0
+
+
+def timed_run(command: list[str], env: dict[str, str]) -> tuple[float, int]:
+    start = time.perf_counter()
+    result = subprocess.run(command, env=env, capture_output=True)
+    return time.perf_counter() - start, result.returncode
+
+
+def precheck_report(runs: int) -> dict:
+    """
+    Sync once against the stand-in servers, then time fresh interpreters running the precheck while nothing has
+    changed and after an assignment has been added.
+
+    :param runs: The number of times each precheck is timed
+    :return: The median wall times and whether each precheck saw a change
+    """
+    env = os.environ | {"CANVAS_ACCESS_TOKEN": "benchmark", "NOTION_KEY": "benchmark",
+                        "NOTION_DATABASE_ID": "benchmark", "PYTHONPATH": os.getcwd()}
+    os.environ.update({key: env[key] for key in ("CANVAS_ACCESS_TOKEN", "NOTION_KEY", "NOTION_DATABASE_ID")})
+    report = {}
+    with tempfile.TemporaryDirectory() as directory, MockCanvasServer(5, 50, 2000) as canvas, \
+            MockNotionServer() as notion:
+        canvas_config_path, notion_config_path = write_configs(
+            directory, parse_sync_args(["--notion-rps", "100", "--canvas-rps", "100"]), canvas.base_url,
+            notion.base_url
+        )
+        run_sync(canvas_config_path, notion_config_path, False)
+        command = [sys.executable, "-c", PRECHECK_SCRIPT, canvas_config_path, notion_config_path]
+        for name in ("unchanged", "changed"):
+            if name == "changed":
+                canvas.assignments_per_course += 1
+            timings = [timed_run(command, env) for _ in range(runs)]
+            report[f"precheck_{name}_s"] = statistics.median(duration for duration, _ in timings)
+            report[f"precheck_{name}_saw_changes"] = all(returncode == 3 for _, returncode in timings)
+    return report
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="times each measurement is repeated")
+    parser.add_argument("--json", action="store_true", help="print the report as json")
+    args = parser.parse_args(argv)
+
+    report = {f"import_{module}_s": statistics.median(import_time(module) for _ in range(args.runs))
+              for module in MODULES}
+    report["interpreter_startup_s"] = statistics.median(
+        timed_run([sys.executable, "-c", "pass"], dict(os.environ))[0] for _ in range(args.runs)
+    )
+    report |= precheck_report(args.runs)
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+    for key, value in report.items():
+        print(f"{key:32} {value:.3f}" if isinstance(value, float) else f"{key:32} {value}")
+
+
+if __name__ == "__main__":
+    main()
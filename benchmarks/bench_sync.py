@@ -0,0 +1,215 @@
+"""
+Offline benchmark of a full Canvas to Notion sync against local stand-in servers.
+
+Run from the repository root, e.g.
+    python -m benchmarks.bench_sync --courses 10 --assignments 200 --description-size 4000 --stream
+
+Canvas failures can be injected to measure retries and resuming, e.g.
+    python -m benchmarks.bench_sync --transient-failures 5 --failing-course 3
+"""
+from __future__ import annotations
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import threading
+import statistics
+import tracemalloc
+
+import requests
+
+from benchmarks.mock_servers import MockCanvasServer, MockNotionServer
+from src.canvas import CanvasAPIInterface, CanvasRequestError
+from src.notion import NotionAPIInterface
+from src.pipeline import StreamingPipeline
+
+
+class RequestTimer:
+    """
+    Records the duration and status code of every request sent through a requests session.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.__lock = threading.Lock()
+        self.__original_send = requests.Session.send
+
+    def __enter__(self):
+        timer = self
+
+        def timed_send(session, request, **kwargs):
+            start = time.perf_counter()
+            response = timer.__original_send(session, request, **kwargs)
+            with timer.__lock:
+                timer.records.append((request.url, request.method, response.status_code, start,
+                                      time.perf_counter() - start))
+            return response
+
+        requests.Session.send = timed_send
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        requests.Session.send = self.__original_send
+
+
+def percentiles(durations: list[float]) -> dict[str, float]:
+    if not durations:
+        return {}
+    if len(durations) == 1:
+        return {"p50": durations[0], "p90": durations[0], "p99": durations[0]}
+    cuts = statistics.quantiles(durations, n=100, method="inclusive")
+    return {"p50": cuts[49], "p90": cuts[89], "p99": cuts[98]}
+
+
+def write_configs(directory: str, args: argparse.Namespace, canvas_url: str, notion_url: str) -> tuple[str, str]:
+    with open("config/canvas.json") as cfg:
+        canvas_config = json.load(cfg)
+    canvas_config |= {
+        "canvas_url": f"{canvas_url}canvas/",
+        "session_cache_path": os.path.join(directory, "canvas_session.json"),
+        "max_concurrent_requests": args.canvas_workers,
+    }
+    canvas_config["incremental_fetch"] |= {"enabled": args.incremental,
+                                           "timestamps_path": os.path.join(directory, "course_sync_times.json")}
+    canvas_config["response_cache"] |= {"path": os.path.join(directory, "canvas_response_cache")}
+    canvas_config["rate_limit"] |= {"requests_per_second": args.canvas_rps, "burst": args.canvas_workers}
+    canvas_config["request_retries"] |= {"backoff_base": 0.05}
+    canvas_config["checkpoint"] |= {"path": os.path.join(directory, "fetch_checkpoint.jsonl")}
+
+    with open("config/notion.json") as cfg:
+        notion_config = json.load(cfg)
+    notion_config |= {
+        "api_base_url": f"{notion_url}v1/",
+        "state_index_path": os.path.join(directory, "sync_state.sqlite3"),
+        "conversion_processes": args.conversion_processes,
+    }
+    notion_config["lazy_descriptions"] |= {"enabled": args.lazy_descriptions}
+    notion_config["writer"] |= {"requests_per_second": args.notion_rps, "backoff_base": 0.05}
+
+    canvas_config_path = os.path.join(directory, "canvas.json")
+    notion_config_path = os.path.join(directory, "notion.json")
+    for path, config in ((canvas_config_path, canvas_config), (notion_config_path, notion_config)):
+        with open(path, "w") as cfg:
+            json.dump(config, cfg)
+    return canvas_config_path, notion_config_path
+
+
+def run_sync(canvas_config_path: str, notion_config_path: str, stream: bool) -> None:
+    if stream:
+        StreamingPipeline(CanvasAPIInterface(canvas_config_path), NotionAPIInterface(notion_config_path)).run()
+        return
+    canvas = CanvasAPIInterface(canvas_config_path)
+    notion = NotionAPIInterface(notion_config_path)
+    canvas.run(notion.prefetch_descriptions)
+    notion.assignments = canvas.assignments
+    if not notion.run():
+        canvas.mark_sync_complete()
+
+
+def summarise(timer: RequestTimer, canvas_netloc: str, start: float, wall_time: float,
+              canvas: MockCanvasServer, notion: MockNotionServer, peak_traced: int | None) -> dict:
+    canvas_durations = sorted(record[4] for record in timer.records if canvas_netloc in record[0])
+    notion_records = [record for record in timer.records if canvas_netloc not in record[0]]
+    notion_durations = sorted(record[4] for record in notion_records)
+    first_write = min((record[3] for record in notion_records), default=None)
+    # When the calendar is complete, even if page bodies are still being filled in
+    last_page_created = max((record[3] + record[4] for record in notion_records
+                             if record[1] == "POST" and record[0].endswith("/pages")), default=None)
+    return {
+        "wall_time_s": wall_time,
+        "time_to_first_notion_request_s": first_write - start if first_write is not None else None,
+        "time_to_all_pages_created_s": last_page_created - start if last_page_created is not None else None,
+        "canvas_requests": len(canvas_durations),
+        "canvas_retries": sum(1 for record in timer.records if canvas_netloc in record[0] and record[2] >= 500),
+        "canvas_latency_s": percentiles(canvas_durations),
+        "notion_requests": len(notion_durations),
+        "notion_rate_limited": notion.rate_limited_responses,
+        "notion_pages_created": notion.pages_created,
+        "notion_blocks_written": notion.blocks_appended,
+        "notion_latency_s": percentiles(notion_durations),
+        "pages_per_second": notion.pages_created / wall_time if wall_time else None,
+        "peak_traced_memory_mb": peak_traced / 2 ** 20 if peak_traced is not None else None,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10,
+    }
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--courses", type=int, default=10)
+    parser.add_argument("--assignments", type=int, default=50, help="assignments per course")
+    parser.add_argument("--description-size", type=int, default=2000, help="characters of HTML per description")
+    parser.add_argument("--notion-latency", type=float, default=0.05, help="seconds added to every Notion response")
+    parser.add_argument("--notion-429", type=float, default=0.02, help="fraction of Notion requests rate limited")
+    parser.add_argument("--notion-rps", type=float, default=3)
+    parser.add_argument("--canvas-rps", type=float, default=20)
+    parser.add_argument("--canvas-workers", type=int, default=4)
+    parser.add_argument("--conversion-processes", type=int, default=0)
+    parser.add_argument("--stream", action="store_true", help="use the streaming pipeline")
+    parser.add_argument("--incremental", action="store_true", help="only fetch assignments updated since last sync")
+    parser.add_argument("--lazy-descriptions", action="store_true",
+                        help="create pages without their body first and fill the bodies in afterwards")
+    parser.add_argument("--resync", action="store_true", help="run a second, steady state sync and report it")
+    parser.add_argument("--transient-failures", type=int, default=0,
+                        help="Canvas assignment requests that fail with a 503 before Canvas recovers")
+    parser.add_argument("--failing-course", type=int, metavar="ID",
+                        help="course whose assignments always fail on the first run, which is then resumed")
+    parser.add_argument("--trace-memory", action="store_true", help="report peak Python heap usage (slower)")
+    parser.add_argument("--json", action="store_true", help="print the report as json")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    os.environ.update({"CANVAS_ACCESS_TOKEN": "benchmark", "NOTION_KEY": "benchmark",
+                       "NOTION_DATABASE_ID": "benchmark"})
+
+    reports = {}
+    with tempfile.TemporaryDirectory() as directory, \
+            MockCanvasServer(args.courses, args.assignments, args.description_size) as canvas, \
+            MockNotionServer(args.notion_latency, args.notion_429) as notion:
+        canvas_config_path, notion_config_path = write_configs(directory, args, canvas.base_url, notion.base_url)
+        canvas_netloc = canvas.base_url.split("//")[1].rstrip("/")
+        canvas.transient_failures = args.transient_failures
+        if args.failing_course is not None:
+            canvas.failing_courses = {args.failing_course}
+        run_names = ["initial"] + (["resumed"] if args.failing_course is not None else []) + \
+            (["steady_state"] if args.resync else [])
+        for run_name in run_names:
+            if run_name == "resumed":
+                canvas.failing_courses = set()
+            if args.trace_memory:
+                tracemalloc.start()
+            with RequestTimer() as timer:
+                start = time.perf_counter()
+                try:
+                    run_sync(canvas_config_path, notion_config_path, args.stream)
+                    interrupted = False
+                except CanvasRequestError:
+                    interrupted = True
+                wall_time = time.perf_counter() - start
+            peak_traced = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+            if args.trace_memory:
+                tracemalloc.stop()
+            reports[run_name] = summarise(timer, canvas_netloc, start, wall_time, canvas, notion, peak_traced)
+            reports[run_name]["interrupted"] = interrupted
+            notion.pages_created = notion.blocks_appended = notion.rate_limited_responses = 0
+
+    if args.json:
+        json.dump(reports, sys.stdout, indent=2)
+        print()
+        return
+    for run_name, report in reports.items():
+        print(f"\n== {run_name} ==")
+        for key, value in report.items():
+            if isinstance(value, dict):
+                value = ", ".join(f"{name}={duration * 1000:.1f}ms" for name, duration in value.items())
+            elif isinstance(value, float):
+                value = f"{value:.3f}"
+            print(f"{key:32} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+from __future__ import annotations
+import re
+import json
+import hashlib
+import time
+import uuid
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body, headers: dict[str, str] | None = None) -> None:
+        encoded = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+
+class MockServer:
+    """
+    Runs an HTTP server on a free local port in a background thread.
+    """
+
+    def __init__(self, handler_class: type[BaseHTTPRequestHandler]):
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        self.__server.daemon_threads = True
+        self.__server.mock = self
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def __enter__(self):
+        self.__thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+
+
+class MockCanvasServer(MockServer):
+    """
+    Emulates the Canvas endpoints used by CanvasAPIInterface: courses.json, course assignments and assignment groups,
+    with Link header pagination, ETag revalidation and a leaky bucket X-Rate-Limit-Remaining header. Failures can be
+    injected with failing_courses, whose assignment requests always fail, and transient_failures, the number of
+    assignment requests to fail with a 503 before succeeding.
+    """
+
+    def __init__(self, courses: int, assignments_per_course: int, description_size: int,
+                 rate_limit_bucket: float = 700, rate_limit_refill: float = 10):
+        self.courses = [{"id": course_id, "course_code": f"COMPSCI {100 + course_id}"}
+                        for course_id in range(1, courses + 1)]
+        self.assignments_per_course = assignments_per_course
+        self.description = self.__make_description(description_size)
+        self.rate_limit_bucket = rate_limit_bucket
+        self.rate_limit_refill = rate_limit_refill
+        self.remaining = rate_limit_bucket
+        self.last_refill = time.monotonic()
+        self.request_count = 0
+        self.failing_courses = set()
+        self.transient_failures = 0
+        self.lock = threading.Lock()
+        super().__init__(_CanvasHandler)
+
+    @staticmethod
+    def __make_description(size: int) -> str:
+        paragraph = "<p>Complete the <strong>lab exercises</strong> and submit them on " \
+                    "<a href=\"https://example.com\"><span>the portal</span></a>.</p>\n"
+        return (paragraph * (size // len(paragraph) + 1))[:size] if size else ""
+
+    def take_rate_limit(self) -> float:
+        with self.lock:
+            now = time.monotonic()
+            self.remaining = min(self.rate_limit_bucket,
+                                 self.remaining + (now - self.last_refill) * self.rate_limit_refill) - 1
+            self.last_refill = now
+            self.request_count += 1
+            return self.remaining
+
+    def assignment(self, course_id: int, index: int) -> dict:
+        assignment_id = course_id * 100000 + index
+        return {
+            "id": assignment_id,
+            "name": f"Lab {index}",
+            "description": self.description,
+            "due_at": f"2026-{index % 12 + 1:02d}-15T23:59:00Z",
+            "unlock_at": None,
+            "updated_at": "2026-01-01T00:00:00Z",
+            "html_url": f"https://canvas.example.com/courses/{course_id}/assignments/{assignment_id}",
+            "assignment_group_id": course_id * 10 + index % 3,
+        }
+
+
+class _CanvasHandler(_QuietHandler):
+    def do_GET(self):
+        mock: MockCanvasServer = self.server.mock
+        remaining = mock.take_rate_limit()
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        per_page = int(query.get("per_page", ["10"])[0])
+        page = int(query.get("page", ["1"])[0])
+
+        if url.path.endswith("/users/self"):
+            self._send_json(200, {"id": 1})
+            return
+        if url.path.endswith("/courses.json"):
+            items = mock.courses
+        elif match := re.search(r"/courses/(\d+)/assignments$", url.path):
+            course_id = int(match.group(1))
+            if course_id in mock.failing_courses:
+                self._send_json(500, {"errors": [{"message": "internal error"}]})
+                return
+            with mock.lock:
+                transient_failure = mock.transient_failures > 0
+                mock.transient_failures -= transient_failure
+            if transient_failure:
+                self._send_json(503, {"errors": [{"message": "unavailable"}]}, {"Retry-After": "0.05"})
+                return
+            start = (page - 1) * per_page
+            stop = min(start + per_page, mock.assignments_per_course)
+            page_items = [mock.assignment(course_id, index) for index in range(start, stop)]
+            self.__send_page(page_items, page, stop < mock.assignments_per_course, url, query, remaining)
+            return
+        elif match := re.search(r"/courses/(\d+)/assignment_groups$", url.path):
+            course_id = int(match.group(1))
+            items = [{"id": course_id * 10 + group, "name": name}
+                     for group, name in enumerate(("Labs", "Quizzes", "Assignments"))]
+        else:
+            self._send_json(404, {"errors": [{"message": "not found"}]})
+            return
+
+        start = (page - 1) * per_page
+        self.__send_page(items[start:start + per_page], page, start + per_page < len(items), url, query, remaining)
+
+    def __send_page(self, items, page, has_next, url, query, remaining) -> None:
+        headers = {"X-Rate-Limit-Remaining": f"{remaining:.1f}"}
+        if has_next:
+            next_query = "&".join(f"{key}={values[0]}" for key, values in query.items() if key != "page")
+            headers["Link"] = f"<http://{self.headers['Host']}{url.path}?{next_query}&page={page + 1}>; rel=\"next\""
+        headers["ETag"] = f"W/\"{hashlib.sha256(json.dumps(items).encode('utf-8')).hexdigest()[:16]}\""
+        if self.headers.get("If-None-Match") == headers["ETag"]:
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._send_json(200, items, headers)
+
+
+class MockNotionServer(MockServer):
+    """
+    Emulates the Notion page, block, block children and database query endpoints, with injected latency and randomly
+    injected 429 responses that carry a Retry-After header. Created pages and their blocks are kept so that database
+    queries can find them and page bodies can be replaced.
+    """
+
+    def __init__(self, latency: float = 0.0, rate_limited_fraction: float = 0.0, retry_after: float = 0.5,
+                 seed: int = 0):
+        self.latency = latency
+        self.rate_limited_fraction = rate_limited_fraction
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.pages_created = 0
+        self.pages = {}
+        self.queries = 0
+        self.blocks_appended = 0
+        self.blocks_deleted = 0
+        self.children = {}
+        self.rate_limited_responses = 0
+        self.lock = threading.Lock()
+        super().__init__(_NotionHandler)
+
+    def append_children(self, page_id: str, children: list[dict]) -> None:
+        """
+        Keep the blocks appended to a page, giving each an id. Must be called with the lock held.
+
+        :param page_id: The id of the page
+        :param children: The blocks appended to it
+        :return: None
+        """
+        self.blocks_appended += len(children)
+        self.children.setdefault(page_id, []).extend({"object": "block", "id": str(uuid.uuid4())} | block
+                                                     for block in children)
+
+    def should_rate_limit(self) -> bool:
+        with self.lock:
+            rate_limited = self.random.random() < self.rate_limited_fraction
+            self.rate_limited_responses += rate_limited
+            return rate_limited
+
+
+class _NotionHandler(_QuietHandler):
+    def __handle(self, method: str) -> None:
+        mock: MockNotionServer = self.server.mock
+        body = self._read_body()
+        time.sleep(mock.latency)
+        if mock.should_rate_limit():
+            self._send_json(429, {"code": "rate_limited"}, {"Retry-After": str(mock.retry_after)})
+            return
+
+        path = urlsplit(self.path).path
+        if method == "POST" and path.endswith("/v1/pages"):
+            payload = json.loads(body)
+            page = {"object": "page", "id": str(uuid.uuid4()), "archived": False,
+                    "properties": payload["properties"]}
+            with mock.lock:
+                mock.pages_created += 1
+                mock.append_children(page["id"], payload.get("children") or [])
+                mock.pages[page["id"]] = page
+            self._send_json(200, page)
+        elif method == "PATCH" and (match := re.search(r"/v1/pages/([^/]+)$", path)):
+            payload = json.loads(body)
+            with mock.lock:
+                page = mock.pages.setdefault(match.group(1), {"object": "page", "id": match.group(1),
+                                                              "archived": False, "properties": {}})
+                page["properties"] |= payload.get("properties", {})
+                page["archived"] = payload.get("archived", page["archived"])
+            self._send_json(200, page)
+        elif method == "POST" and re.search(r"/v1/databases/[^/]+/query$", path):
+            self.__query(mock, json.loads(body))
+        elif method == "PATCH" and (match := re.search(r"/v1/blocks/([^/]+)/children$", path)):
+            with mock.lock:
+                mock.append_children(match.group(1), json.loads(body).get("children") or [])
+            self._send_json(200, {"object": "list", "results": []})
+        elif method == "GET" and (match := re.search(r"/v1/blocks/([^/]+)/children$", path)):
+            query = parse_qs(urlsplit(self.path).query)
+            start = int(query.get("start_cursor", ["0"])[0])
+            stop = start + int(query.get("page_size", ["100"])[0])
+            with mock.lock:
+                blocks = list(mock.children.get(match.group(1), []))
+            self._send_json(200, {"object": "list", "results": blocks[start:stop], "has_more": stop < len(blocks),
+                                  "next_cursor": str(stop) if stop < len(blocks) else None})
+        elif method == "DELETE" and (match := re.search(r"/v1/blocks/([^/]+)$", path)):
+            with mock.lock:
+                for blocks in mock.children.values():
+                    for block in blocks:
+                        if block["id"] == match.group(1):
+                            blocks.remove(block)
+                            mock.blocks_deleted += 1
+                            self._send_json(200, block | {"archived": True})
+                            return
+            self._send_json(404, {"code": "object_not_found"})
+        else:
+            self._send_json(404, {"code": "object_not_found"})
+
+    def __query(self, mock: MockNotionServer, payload: dict) -> None:
+        modules = {condition["select"]["equals"] for condition in payload.get("filter", {}).get("or", [])}
+        with mock.lock:
+            mock.queries += 1
+            pages = [page for page in mock.pages.values()
+                     if not modules or
+                     (page["properties"].get("module", {}).get("select") or {}).get("name") in modules]
+        start = int(payload.get("start_cursor") or 0)
+        stop = start + payload.get("page_size", 100)
+        self._send_json(200, {"object": "list", "results": pages[start:stop], "has_more": stop < len(pages),
+                              "next_cursor": str(stop) if stop < len(pages) else None})
+
+    def do_POST(self):
+        self.__handle("POST")
+
+    def do_PATCH(self):
+        self.__handle("PATCH")
+
+    def do_GET(self):
+        self.__handle("GET")
+
+    def do_DELETE(self):
+        self.__handle("DELETE")
@@ -1,15 +1,133 @@
-from src.canvas import CanvasAPIInterface
-from src.notion import NotionAPIInterface
+from __future__ import annotations
+import argparse
+from typing import TYPE_CHECKING
 
+from src.canvas import CanvasAPIInterface, CanvasRequestError
+from src.instrumentation import metrics
+
+# The modules of each mode are imported once the mode is known, so a run stopped by --precheck imports none of them
+if TYPE_CHECKING:
+    from src.notion import NotionAPIInterface
+    from src.sinks import AssignmentSink, SinkFanout
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Sync Canvas assignments into a Notion calendar database.")
+    parser.add_argument("--stream", action="store_true",
+                        help="write Notion pages while Canvas courses are still being fetched")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and poll courses on an adaptive schedule, syncing only changes")
+    parser.add_argument("--batch", metavar="MANIFEST",
+                        help="sync every account listed in a batch manifest, see config/batch.example.json")
+    parser.add_argument("--precheck", action="store_true",
+                        help="exit straight away if Canvas reports that nothing has changed since the last sync. "
+                             "This sends a conditional request for every cached listing page, one at a time")
+    parser.add_argument("--ics", metavar="PATH", help="also export assignments with a due date to an iCalendar file")
+    parser.add_argument("--jsonl", metavar="PATH", help="also export assignments to a JSON Lines file")
+    parser.add_argument("--no-notion", action="store_true",
+                        help="only export assignments to the files given by --ics and --jsonl, without syncing Notion")
+    parser.add_argument("--metrics-json", metavar="PATH", help="write the timing report to a json file")
+    parser.add_argument("--metrics-prometheus", metavar="PATH",
+                        help="write the timing report to a file in the Prometheus text format")
+    return parser.parse_args()
+
+
+def export_metrics(args: argparse.Namespace) -> None:
+    print(f"\n{metrics.format_report()}")
+    if args.metrics_json:
+        with open(args.metrics_json, "w") as metrics_file:
+            metrics_file.write(metrics.to_json())
+    if args.metrics_prometheus:
+        with open(args.metrics_prometheus, "w") as metrics_file:
+            metrics_file.write(metrics.to_prometheus())
+
+
+def create_sinks(args: argparse.Namespace, canvas: CanvasAPIInterface) -> list[AssignmentSink]:
+    from src.sinks import ICSCalendarSink, JSONLinesSink
+
+    sinks = []
+    if args.ics:
+        sinks.append(ICSCalendarSink(args.ics, canvas.canvas_url))
+    if args.jsonl:
+        sinks.append(JSONLinesSink(args.jsonl))
+    return sinks
+
+
+def create_destination(args: argparse.Namespace, canvas: CanvasAPIInterface) -> NotionAPIInterface | SinkFanout:
+    from src.notion import NotionAPIInterface
+    from src.sinks import SinkFanout
+
+    notion = None if args.no_notion else NotionAPIInterface()
+    sinks = create_sinks(args, canvas)
+    if not sinks:
+        return notion
+    return SinkFanout(notion, sinks)
+
+
+def sync(args: argparse.Namespace) -> None:
+    if args.batch:
+        from src.batch import BatchRunner
+
+        with metrics.stage("batch_sync"):
+            BatchRunner(args.batch).run()
+        export_metrics(args)
+        return
+
+    if args.watch:
+        from src.notion import NotionAPIInterface
+        from src.watch import WatchRunner
+
+        c = CanvasAPIInterface()
+        WatchRunner(c, NotionAPIInterface(), c.watch_config).run()
+        export_metrics(args)
+        return
+
+    if args.no_notion and not (args.ics or args.jsonl):
+        raise SystemExit("--no-notion needs at least one of --ics or --jsonl")
+
+    if args.precheck:
+        from src.precheck import SyncPrecheck
+
+        if not SyncPrecheck().has_changes():
+            print("Nothing has changed since the last sync.")
+            return
+
+    if args.stream:
+        from src.pipeline import StreamingPipeline
+
+        with metrics.stage("streaming_sync"):
+            c = CanvasAPIInterface()
+            StreamingPipeline(c, create_destination(args, c), mark_sync_complete=not args.no_notion).run()
+        export_metrics(args)
+        return
 
-def main() -> None:
     c = CanvasAPIInterface()
-    c.run()
-    assignments = c.assignments
+    destination = create_destination(args, c)
+    with metrics.stage("canvas_fetch"):
+        # Descriptions of new pages are converted while the remaining courses are fetched
+        c.run(destination.prefetch_descriptions)
+        assignments = c.assignments
+
+    with metrics.stage("notion_write"):
+        from src.sinks import SinkFanout
 
-    n = NotionAPIInterface()
-    n.assignments = assignments
-    n.run()
+        if isinstance(destination, SinkFanout):
+            failures = destination.sync(assignments, lookahead=len(assignments))
+        else:
+            destination.assignments = assignments
+            failures = destination.run()
+        # Only Notion keeps sync state, so an export on its own does not count as a sync
+        if not failures and not args.no_notion:
+            c.mark_sync_complete()
+    export_metrics(args)
+
+
+def main() -> None:
+    args = parse_args()
+    try:
+        sync(args)
+    except CanvasRequestError as error:
+        raise SystemExit(f"{error}. Completed courses and pages have been saved, run again to resume.")
 
 
 if __name__ == "__main__":
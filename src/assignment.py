@@ -0,0 +1,119 @@
+from __future__ import annotations
+import sys
+import tempfile
+import threading
+from typing import Any
+
+from src.sync_state import SyncStateIndex
+
+
+class DescriptionSpool:
+    """
+    Append-only temporary file that large assignment descriptions are written to, so they do not have to be held in
+    memory between being fetched and being converted.
+    """
+
+    def __init__(self):
+        self.__file = tempfile.TemporaryFile()
+        self.__lock = threading.Lock()
+
+    def store(self, description: str) -> tuple[int, int]:
+        """
+        :param description: The description to spool
+        :return: A tuple of the offset and length of the encoded description in the spool
+        """
+        encoded = description.encode("utf-8")
+        with self.__lock:
+            self.__file.seek(0, 2)
+            offset = self.__file.tell()
+            self.__file.write(encoded)
+        return offset, len(encoded)
+
+    def load(self, offset: int, length: int) -> str:
+        """
+        :param offset: The offset of the description in the spool
+        :param length: The length of the encoded description
+        :return: The description
+        """
+        with self.__lock:
+            self.__file.seek(offset)
+            return self.__file.read(length).decode("utf-8")
+
+
+class Assignment:
+    """
+    A Canvas assignment with the pieces of information needed to create its Notion page. Course names and assignment
+    types are interned so every assignment of a course shares them, and descriptions longer than the spool threshold
+    are kept in a DescriptionSpool and only read back when they are needed. The category is the type the assignment
+    was classified as, e.g. "Quiz".
+    """
+    __slots__ = ("id", "name", "due_at", "unlock_at", "html_url", "course_name", "assignment_type", "category", "extra",
+                 "content_hash", "description_hash", "__description", "__spool", "__spool_offset", "__spool_length")
+    FIELDS = ("id", "name", "due_at", "unlock_at", "html_url")
+
+    def __init__(self, course_name: str, assignment_type: str, fields: dict[str, Any],
+                 spool: DescriptionSpool | None = None, spool_threshold: int = 0, category: str = "Unknown"):
+        """
+        :param course_name: The name of the course the assignment belongs to
+        :param assignment_type: The name of the assignment group the assignment belongs to
+        :param fields: The relevant keys of the Canvas assignment json
+        :param spool: The spool to keep a long description in. If this is None, the description is kept in memory
+        :param spool_threshold: Descriptions with more characters than this are spooled
+        :param category: The type the assignment was classified as
+        """
+        self.id = fields.get("id")
+        self.name = fields.get("name")
+        self.due_at = fields.get("due_at")
+        self.unlock_at = fields.get("unlock_at")
+        self.html_url = fields.get("html_url")
+        self.course_name = sys.intern(course_name)
+        self.assignment_type = sys.intern(assignment_type)
+        self.category = sys.intern(category)
+        extra = {key: value for key, value in fields.items() if key not in self.FIELDS and key != "description"}
+        self.extra = extra or None
+        # The hash is worked out while the description is still in memory, so it never has to be read back for it
+        self.content_hash = SyncStateIndex.content_hash(
+            {"course_name": course_name, "assignment_type": assignment_type, "category": category} | fields
+        )
+        self.description_hash = SyncStateIndex.content_hash({"description": fields.get("description")})
+
+        description = fields.get("description")
+        self.__spool = None
+        self.__spool_offset = self.__spool_length = 0
+        if spool is not None and description and len(description) > spool_threshold:
+            self.__description = None
+            self.__spool = spool
+            self.__spool_offset, self.__spool_length = spool.store(description)
+        else:
+            self.__description = description
+
+    @property
+    def description(self) -> str | None:
+        """
+        Getter method that returns the HTML description, reading it back from the spool if it was spooled.
+
+        :return: The HTML description of the assignment, if it has one
+        """
+        if self.__spool is not None:
+            return self.__spool.load(self.__spool_offset, self.__spool_length)
+        return self.__description
+
+    @property
+    def has_description(self) -> bool:
+        """
+        :return: Whether the assignment has a description, without reading it back from the spool
+        """
+        return self.__spool is not None or bool(self.__description)
+
+    def as_dict(self) -> dict[str, Any]:
+        """
+        :return: The assignment as a dictionary with the same keys as the Canvas json it was created from, plus the
+        course name, assignment type and category
+        """
+        return {"course_name": self.course_name, "assignment_type": self.assignment_type,
+                "category": self.category} | \
+            {field: getattr(self, field) for field in self.FIELDS} | \
+            {"description": self.description} | (self.extra or {})
+
+    def __repr__(self) -> str:
+        return f"Assignment(id={self.id!r}, course_name={self.course_name!r}, name={self.name!r})"
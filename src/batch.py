@@ -0,0 +1,151 @@
+from __future__ import annotations
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from requests.adapters import HTTPAdapter
+
+from src.canvas import CanvasAPIInterface
+from src.description_converter import DescriptionConverter
+from src.notion import NotionAPIInterface
+from src.pipeline import StreamingPipeline
+from src.rate_limiter import TokenBucketRateLimiter
+
+
+class BatchRunner:
+    """
+    Syncs several Canvas accounts into their own Notion databases concurrently in one process. Every account has its
+    own config files and credentials, while the connection pool, description converter and rate limiters are shared.
+    Credentials are only ever read from the environment variables named in an account's manifest entry, and no two
+    accounts may share a cache or state file.
+    """
+    # The config keys of every file that holds the state of a single account
+    CANVAS_STATE_PATHS = (("session_cache_path",), ("response_cache", "path"), ("checkpoint", "path"),
+                          ("incremental_fetch", "timestamps_path"))
+    NOTION_STATE_PATHS = (("state_index_path",),)
+
+    def __init__(self, manifest_path: str):
+        """
+        :param manifest_path: The path of the batch manifest that lists the accounts to sync
+        """
+        with open(manifest_path) as manifest:
+            self.__manifest = json.load(manifest)
+        self.__check_state_paths(self.__manifest["accounts"])
+        canvas_rate_limit = self.__manifest["canvas_rate_limit"]
+        self.__canvas_rate_limiter = TokenBucketRateLimiter(
+            canvas_rate_limit["requests_per_second"],
+            canvas_rate_limit["burst"],
+            remaining_header="X-Rate-Limit-Remaining",
+            low_remaining_threshold=canvas_rate_limit["low_remaining_threshold"],
+            low_remaining_backoff=canvas_rate_limit["low_remaining_backoff"],
+        )
+        notion_requests_per_second = self.__manifest["notion_requests_per_second"]
+        self.__notion_rate_limiter = TokenBucketRateLimiter(notion_requests_per_second,
+                                                            max(1, int(notion_requests_per_second)))
+        self.__http_adapter = HTTPAdapter(pool_connections=len(self.__manifest["accounts"]) + 1,
+                                          pool_maxsize=self.__manifest["connection_pool_size"])
+        self.__converter = DescriptionConverter(self.__manifest["conversion_processes"])
+
+    @classmethod
+    def __check_state_paths(cls, accounts: list[dict[str, Any]]) -> None:
+        """
+        Make sure no two accounts share a cache or state file. Cached responses are keyed by url only, and the state
+        index maps Canvas assignments to pages of one database, so sharing either would mix up the accounts.
+
+        :param accounts: The manifest entries of the accounts
+        :return: None
+        """
+        owners = {}
+        for account in accounts:
+            for config_key, keys in (("canvas_config", cls.CANVAS_STATE_PATHS),
+                                     ("notion_config", cls.NOTION_STATE_PATHS)):
+                with open(account[config_key]) as cfg:
+                    config = json.load(cfg)
+                for key_path in keys:
+                    value = config
+                    for key in key_path:
+                        value = value[key]
+                    path = os.path.abspath(value)
+                    if path in owners and owners[path] != account["name"]:
+                        raise ValueError(f"Accounts {owners[path]} and {account['name']} both use {value} for "
+                                         f"{'.'.join(key_path)}. Every account needs its own state files.")
+                    owners[path] = account["name"]
+
+    @staticmethod
+    def __getenv(account: dict[str, Any], key: str) -> str:
+        """
+        :param account: The manifest entry of the account
+        :param key: The key of the manifest entry that names an environment variable
+        :return: The value of the environment variable
+        """
+        value = os.getenv(account[key])
+        if not value:
+            raise ValueError(f"The {account[key]} environment variable for {account['name']} is not set.")
+        return value
+
+    def __sync_account(self, account: dict[str, Any]) -> None:
+        """
+        Sync a single account. The browser login is disabled since accounts run concurrently, so every account needs
+        a Canvas access token or a cached session. An account without canvas_access_token_env uses its cached
+        session.
+
+        :param account: The manifest entry of the account
+        :return: None
+        """
+        access_token = self.__getenv(account, "canvas_access_token_env") \
+            if account.get("canvas_access_token_env") else None
+        canvas = CanvasAPIInterface(account["canvas_config"],
+                                    access_token=access_token,
+                                    rate_limiter=self.__canvas_rate_limiter,
+                                    http_adapter=self.__http_adapter,
+                                    allow_browser_login=False,
+                                    use_environment_credentials=False)
+        notion = NotionAPIInterface(account["notion_config"],
+                                    notion_key=self.__getenv(account, "notion_key_env"),
+                                    database_id=self.__getenv(account, "notion_database_id_env"),
+                                    rate_limiter=self.__notion_rate_limiter,
+                                    http_adapter=self.__http_adapter,
+                                    converter=self.__converter,
+                                    use_environment_credentials=False)
+        if self.__manifest["stream"]:
+            StreamingPipeline(canvas, notion).run()
+            return
+        canvas.run(notion.prefetch_descriptions)
+        notion.assignments = canvas.assignments
+        if not notion.run():
+            canvas.mark_sync_complete()
+
+    def __try_sync_account(self, account: dict[str, Any]) -> Exception | None:
+        """
+        Sync a single account without letting a failure stop the other accounts.
+
+        :param account: The manifest entry of the account
+        :return: The error that stopped the sync, or None if it succeeded
+        """
+        try:
+            self.__sync_account(account)
+        except Exception as error:  # Includes CanvasRequestError and unset credentials
+            return error
+        return None
+
+    def run(self) -> dict[str, Exception | None]:
+        """
+        Sync every account in the manifest.
+
+        :return: A dictionary with the name of each account as the key, and the error that stopped its sync as the
+        value, or None if it succeeded
+        """
+        accounts = self.__manifest["accounts"]
+        try:
+            with ThreadPoolExecutor(max_workers=self.__manifest["max_concurrent_accounts"]) as executor:
+                errors = dict(zip((account["name"] for account in accounts),
+                                  executor.map(self.__try_sync_account, accounts)))
+        finally:
+            self.__converter.close()
+            self.__http_adapter.close()
+
+        print()
+        for name, error in errors.items():
+            print(f"{name}: {'synced' if error is None else f'failed ({error!r})'}")
+        return errors
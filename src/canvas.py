@@ -1,34 +1,150 @@
 from __future__ import annotations
+import os
 import re
-import sys
 import time
 import json
 import itertools
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
 from getpass import getpass
-from typing import Union, Type, Any
-
-from selenium import webdriver
-from selenium.common import TimeoutException
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.by import By
-import requests
+from typing import TYPE_CHECKING, Union, Type, Any, Callable, Iterator, Iterable
+
+from src.assignment import Assignment, DescriptionSpool
+from src.classification import AssignmentClassifier, DueDateWindow
+from src.instrumentation import metrics
+from src.rate_limiter import TokenBucketRateLimiter
+from src.response_cache import HTTPResponseCache
+from src.session_cache import CookieSessionCache
+from src.sync_state import CourseSyncTimestamps, FetchCheckpoint
+
+# Selenium, requests and dotenv are imported where they are used, since importing them takes longer than a run that
+# finds nothing to sync
+if TYPE_CHECKING:
+    import requests
+    from requests.adapters import HTTPAdapter
 
 # Create a decent type hint for JSON files
 JSONType = Union[dict[str, Any], list[Any], int, str, float, bool, Type[None]]
 
+COURSES_API_SUFFIX = "courses.json?enrollment_state=active"
+
+
+def api_listing_url(canvas_url: str, api_suffix: str, per_page: int) -> str:
+    """
+    :param canvas_url: The Canvas url, ending in a slash
+    :param api_suffix: The suffix appended to the api base url
+    :param per_page: The number of results to request per page
+    :return: The url of the first page of a Canvas API listing
+    """
+    return f"{canvas_url}api/v1/{api_suffix}{'?' if '?' not in api_suffix else '&'}per_page={per_page}"
+
+
+def assignment_api_suffixes(course_id: int, incremental_fetch: dict[str, Any]) -> list[str]:
+    """
+    :param course_id: The ID of the course whose assignments are of interest
+    :param incremental_fetch: The incremental fetch section of the config file
+    :return: The api suffixes of the assignment listings requested for a course, one per bucket in incremental
+    fetch mode
+    """
+    if not incremental_fetch["enabled"]:
+        return [f"courses/{course_id}/assignments"]
+    return [f"courses/{course_id}/assignments?bucket={bucket}&order_by=due_at"
+            for bucket in incremental_fetch["buckets"]]
+
+
+def assignment_groups_api_suffix(course_id: int) -> str:
+    """
+    :param course_id: The ID of the course whose assignment groups are of interest
+    :return: The api suffix of the assignment group listing of a course
+    """
+    return f"courses/{course_id}/assignment_groups"
+
+
+def due_date_window_config(window_config: dict[str, Any], incremental_fetch: dict[str, Any]) -> dict[str, Any]:
+    """
+    :param window_config: The due date window section of the config file
+    :param incremental_fetch: The incremental fetch section of the config file
+    :return: The due date window fetches actually use
+    """
+    if incremental_fetch["enabled"]:
+        # An assignment dropped for being due too far ahead would not be fetched again once it came into the window,
+        # since incremental fetches skip assignments that have not been updated
+        return window_config | {"future_days": None}
+    return window_config
+
+
+def response_cache_ttl(ttls: dict[str, float], api_suffix: str) -> float:
+    """
+    Get the response cache ttl for an API endpoint. The endpoint is the last part of the suffix path,
+    e.g. "assignment_groups" for "courses/1/assignment_groups".
+
+    :param ttls: The ttls section of the response cache config
+    :param api_suffix: The suffix appended to the api base url
+    :return: The number of seconds cached responses from the endpoint are used without revalidating them
+    """
+    endpoint = api_suffix.split("?")[0].rsplit("/", 1)[-1].removesuffix(".json")
+    return ttls.get(endpoint, 0)
+
+
+class CanvasRequestError(RuntimeError):
+    """
+    Raised when a Canvas API request still fails after it has been retried.
+    """
+
+    def __init__(self, message: str, status_code: int | None = None):
+        """
+        :param message: The error message
+        :param status_code: The status code of the last response, or None if no response was received
+        """
+        super().__init__(message)
+        self.status_code = status_code
+
 
 class CanvasAPIInterface:
-    def __init__(self):
+    def __init__(self, config_path: str = "config/canvas.json", access_token: str | None = None,
+                 rate_limiter: TokenBucketRateLimiter | None = None, http_adapter: HTTPAdapter | None = None,
+                 allow_browser_login: bool = True, use_environment_credentials: bool = True):
+        """
+        :param config_path: The path of the config file to load
+        :param access_token: A Canvas personal access token. Defaults to the CANVAS_ACCESS_TOKEN environment variable
+        :param rate_limiter: A rate limiter shared with other interfaces. Defaults to one created from the config
+        :param http_adapter: A connection pool shared with other interfaces. Defaults to a pool for this session only
+        :param allow_browser_login: Whether to fall back to an interactive headless browser login
+        :param use_environment_credentials: Whether to fall back to the CANVAS_ACCESS_TOKEN environment variable when
+        no access token is given. Disable this when the interface belongs to one of several accounts
+        """
+        from dotenv import load_dotenv
+        load_dotenv()
+
         # Load the config file
-        with open("config/canvas.json") as cfg:
+        with open(config_path) as cfg:
             self.__config = json.load(cfg)
         self.__canvas_url = self.__verify_canvas_url(self.__config["canvas_url"])
+        self.__course_name_pattern = re.compile(self.__config["course_name_regex"])
+        self.__classifier = AssignmentClassifier(self.__config["assignment_types"])
+        self.__due_date_window = None
         self.__username = None
         self.__password = None
         self.__driver = None
-        self.__session = self.__create_requests_session()
+        self.__access_token = access_token
+        self.__use_environment_credentials = use_environment_credentials
+        self.__allow_browser_login = allow_browser_login
+        self.__shared_http_adapter = http_adapter is not None
+        self.__session = self.__create_requests_session(http_adapter)
+        self.__rate_limiter = rate_limiter or self.__create_rate_limiter(self.__config["rate_limit"])
+        self.__session_cache = CookieSessionCache(self.__config["session_cache_path"],
+                                                  self.__config["session_cache_max_age"])
+        self.__response_cache = HTTPResponseCache(self.__config["response_cache"]["path"])
+        self.__incremental_fetch = self.__config["incremental_fetch"]
+        self.__course_sync_timestamps = CourseSyncTimestamps(self.__incremental_fetch["timestamps_path"])
+        self.__fetch_started_at = None
+        self.__fetched_course_ids = set()
+        self.__resumed_course_ids = set()
+        self.__resumed_fetch_started_at = None
+        self.__checkpoint = FetchCheckpoint(self.__config["checkpoint"]["path"], self.__config["checkpoint"]["max_age"])
+        self.__resumed_courses = {}
+        self.__authenticated = False
+        self.__description_spool = DescriptionSpool()
         self.__assignments = None
 
     @staticmethod
@@ -51,13 +167,37 @@ class CanvasAPIInterface:
         return canvas_url
 
     @staticmethod
-    def __create_requests_session() -> requests.sessions.Session:
+    def __create_requests_session(http_adapter: HTTPAdapter | None = None) -> requests.sessions.Session:
         """
         Creates and returns a new requests session
 
+        :param http_adapter: A connection pool to use instead of the session's own
         :return: Returns a requests session
         """
-        return requests.Session()
+        import requests
+
+        session = requests.Session()
+        if http_adapter is not None:
+            session.mount("https://", http_adapter)
+            session.mount("http://", http_adapter)
+        return session
+
+    @staticmethod
+    def __create_rate_limiter(rate_limit_config: dict[str, int | float]) -> TokenBucketRateLimiter:
+        """
+        Creates a rate limiter shared by all Canvas API requests. The limiter honours the remaining rate limit that
+        Canvas reports in the X-Rate-Limit-Remaining header.
+
+        :param rate_limit_config: The rate limit section of the config file
+        :return: Returns a token bucket rate limiter
+        """
+        return TokenBucketRateLimiter(
+            rate_limit_config["requests_per_second"],
+            rate_limit_config["burst"],
+            remaining_header="X-Rate-Limit-Remaining",
+            low_remaining_threshold=rate_limit_config["low_remaining_threshold"],
+            low_remaining_backoff=rate_limit_config["low_remaining_backoff"],
+        )
 
     def __get_canvas_login(self) -> None:
         """
@@ -77,6 +217,13 @@ class CanvasAPIInterface:
 
         :return: None
         """
+        from selenium import webdriver
+        from selenium.common import TimeoutException
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.common.by import By
+
         options = Options()
         options.headless = True
 
@@ -101,36 +248,250 @@ class CanvasAPIInterface:
             print("Failed logging in.")
             self.__driver.close()
 
+    def __quit_browser(self) -> None:
+        """
+        Shut down the headless browser, if one is running.
+
+        :return: None
+        """
+        if self.__driver:
+            self.__driver.quit()
+            self.__driver = None
+
     def __transfer_cookies(self):
         """
-        Transfer the Canvas cookies from the headless browser into the request session.
+        Transfer the Canvas cookies from the headless browser into the request session. The cookies are also saved
+        to the session cache so that later runs can skip the browser login.
 
         :return: None
         """
         # Code adapted from https://stackoverflow.com/a/58171737
         selenium_user_agent = self.__driver.execute_script("return navigator.userAgent;")
-        self.__session.headers.update({"user-agent": selenium_user_agent})
+        cookies = self.__driver.get_cookies()
+        self.__load_cookies(selenium_user_agent, cookies)
+        self.__session_cache.save(selenium_user_agent, cookies)
 
-        for cookie in self.__driver.get_cookies():
+    def __load_cookies(self, user_agent: str, cookies: list[dict[str, Any]]) -> None:
+        """
+        Load a user agent and browser cookies into the request session.
+
+        :param user_agent: The user agent of the browser the cookies came from
+        :param cookies: The cookies in the format returned by Selenium
+        :return: None
+        """
+        self.__session.headers.update({"user-agent": user_agent})
+        for cookie in cookies:
             self.__session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'])
 
-    def __request_api_data(self, api_suffix: str) -> JSONType | None:
+    def __use_access_token(self) -> bool:
+        """
+        Authenticate the request session with a Canvas personal access token if one was given or is set in the
+        CANVAS_ACCESS_TOKEN environment variable.
+
+        :return: True if an access token was found, otherwise False
+        """
+        access_token = self.__access_token
+        if not access_token and self.__use_environment_credentials:
+            access_token = os.getenv("CANVAS_ACCESS_TOKEN")
+        if not access_token:
+            return False
+        self.__session.headers.update({"Authorization": f"Bearer {access_token}"})
+        return True
+
+    def __use_cached_session(self) -> bool:
+        """
+        Load a cached browser session into the request session and check that Canvas still accepts it. The cache is
+        only cleared if Canvas rejects the session. Any other failure of the check is raised, since the session may
+        well be valid.
+
+        :return: True if the cached session is valid, otherwise False
+        """
+        cached_session = self.__session_cache.load()
+        if not cached_session:
+            return False
+        self.__load_cookies(*cached_session)
+        try:
+            self.__request_url(f"{self.__canvas_url}api/v1/users/self")
+        except CanvasRequestError as error:
+            # A rejected session has already been dropped by __request_url
+            if error.status_code != 401:
+                raise
+            return False
+        return True
+
+    def __authenticate(self) -> None:
+        """
+        Authenticate the request session with Canvas. A personal access token is preferred, then a cached session,
+        and the headless browser login is only used if neither is available.
+
+        :return: None
+        """
+        if self.__authenticated:
+            return
+        if self.__use_access_token():
+            print("Using Canvas access token.\n")
+        else:
+            with metrics.stage("canvas_cached_session"):
+                use_cached_session = self.__use_cached_session()
+            if use_cached_session:
+                print("Using cached Canvas session.\n")
+            elif not self.__allow_browser_login:
+                raise RuntimeError("No Canvas access token or cached session is available and browser login is "
+                                   "disabled.")
+            else:
+                self.__get_canvas_login()
+                with metrics.stage("canvas_browser_login"):
+                    try:
+                        self.__canvas_login()
+                        self.__transfer_cookies()
+                    finally:
+                        # The browser is only needed for its cookies, so it is not left running in watch mode
+                        self.__quit_browser()
+        self.__authenticated = True
+
+    def __drop_authentication(self) -> None:
         """
-        Request data from the Canvas API with a given suffix.
+        Forget a session Canvas has rejected, so that the next fetch authenticates again instead of reusing it.
+
+        :return: None
+        """
+        self.__authenticated = False
+        self.__session.cookies.clear()
+        self.__session_cache.clear()
+
+    def __backoff_delay(self, attempt: int, response: requests.Response | None = None) -> float:
+        """
+        Work out how long to wait before retrying a request. A Retry-After header is used if one was sent, otherwise
+        the delay grows exponentially with each attempt.
+
+        :param attempt: The number of attempts that have already failed
+        :param response: The failed response, if one was received
+        :return: The number of seconds to wait
+        """
+        if response is not None and response.headers.get("Retry-After"):
+            try:
+                return float(response.headers["Retry-After"])
+            except ValueError:
+                pass
+        return self.__config["request_retries"]["backoff_base"] * 2 ** attempt
+
+    @staticmethod
+    def __is_transient_failure(response: requests.Response) -> bool:
+        """
+        :param response: A failed response
+        :return: Whether the request might succeed if it is retried
+        """
+        # Canvas responds to throttled requests with a 403 rather than a 429
+        return response.status_code == 429 or response.status_code >= 500 or \
+            (response.status_code == 403 and "Rate Limit Exceeded" in response.text)
+
+    def __request_url(self, request_url: str, headers: dict[str, str] | None = None) -> requests.Response:
+        """
+        Send a GET request to a full Canvas API url, retrying on rate limiting, server errors and connection errors.
+
+        :param request_url: The url to request
+        :param headers: Any extra headers to send with the request
+        :return: The response if the status code is 200, or 304 for a conditional request
+        """
+        import requests
+
+        error = None
+        status_code = None
+        for attempt in range(self.__config["request_retries"]["max_retries"] + 1):
+            if attempt:
+                metrics.record_retry("canvas")
+            metrics.record_sleep("canvas", self.__rate_limiter.acquire())
+            start = time.perf_counter()
+            try:
+                response = self.__session.get(request_url, headers=headers)
+            except requests.RequestException as exception:
+                metrics.record_request("canvas", None, time.perf_counter() - start)
+                error = str(exception)
+                status_code = None
+                delay = self.__backoff_delay(attempt)
+                time.sleep(delay)
+                metrics.record_sleep("canvas", delay)
+                continue
+
+            metrics.record_request("canvas", response.status_code, time.perf_counter() - start)
+            self.__rate_limiter.update_from_headers(response.headers)
+            if response.status_code == 200 or (headers and response.status_code == 304):
+                return response
+            error = f"status {response.status_code}"
+            status_code = response.status_code
+            if status_code == 401:
+                self.__drop_authentication()
+            if not self.__is_transient_failure(response):
+                break
+            # Hold back every thread sharing the limiter, not just this one
+            self.__rate_limiter.pause(self.__backoff_delay(attempt, response))
+        print(f"Failed response from {request_url} ({error}).")
+        raise CanvasRequestError(f"Canvas request to {request_url} failed ({error})", status_code)
+
+    def __request_page(self, request_url: str, cache_ttl: float) -> tuple[JSONType, str | None]:
+        """
+        Request a single page of a Canvas API listing through the response cache. A cached page younger than the
+        cache ttl is used without contacting Canvas. Older cached pages are revalidated with a conditional request,
+        and the cached body is used if Canvas responds that it has not changed.
+
+        :param request_url: The url of the page to request
+        :param cache_ttl: The number of seconds a cached page can be used without revalidating it
+        :return: A tuple of the json of the page and the url of the next page, if any
+        """
+        cached = self.__response_cache.get(request_url)
+        if cached and time.time() - cached.fetched_at < cache_ttl:
+            return cached.body, cached.next_url
+
+        conditional_headers = {}
+        if cached and cached.etag:
+            conditional_headers["If-None-Match"] = cached.etag
+        if cached and cached.last_modified:
+            conditional_headers["If-Modified-Since"] = cached.last_modified
+        response = self.__request_url(request_url, conditional_headers)
+        if response.status_code == 304:
+            self.__response_cache.touch(request_url, cached)
+            return cached.body, cached.next_url
+
+        body = response.json()
+        next_url = response.links.get("next", {}).get("url")
+        self.__response_cache.put(request_url, body, next_url, response.headers.get("ETag"),
+                                  response.headers.get("Last-Modified"))
+        return body, next_url
+
+    def __iter_api_pages(self, api_suffix: str, revalidate: bool = False) -> Iterator[list[JSONType]]:
+        """
+        Lazily request every page of a Canvas API listing with a given suffix by following the "next" url in the
+        Link header of each response. If enabled in the config, the next page is requested in the background while
+        the current page is being processed.
+
+        :param api_suffix: The suffix to append to the api base url
+        :param revalidate: Whether to revalidate cached pages even if they are younger than their cache ttl
+        :return: An iterator over the json of each page
+        """
+        request_url = api_listing_url(self.__canvas_url, api_suffix, self.__config["api_max_results"])
+        cache_ttl = 0 if revalidate else response_cache_ttl(self.__config["response_cache"]["ttls"], api_suffix)
+        if not self.__config["prefetch_next_page"]:
+            while request_url:
+                page, request_url = self.__request_page(request_url, cache_ttl)
+                yield page
+            return
+
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            pending_page = prefetcher.submit(self.__request_page, request_url, cache_ttl)
+            while pending_page:
+                page, next_url = pending_page.result()
+                pending_page = prefetcher.submit(self.__request_page, next_url, cache_ttl) if next_url else None
+                yield page
+
+    def __request_api_data(self, api_suffix: str, revalidate: bool = False) -> JSONType | None:
+        """
+        Request data from the Canvas API with a given suffix. All pages of the response are combined.
 
         :param api_suffix: The suffix to append to the api base url
+        :param revalidate: Whether to revalidate cached pages even if they are younger than their cache ttl
         :return: A json of the response if the status code is 200
         """
-        request_url = f"{self.__canvas_url}api/v1/{api_suffix}{'?' if '?' not in api_suffix else '&'}" \
-                      f"per_page={self.__config['api_max_results']}"
-        response = self.__session.get(request_url)
-        if response.status_code == 200:
-            return response.json()
-        else:  # If the response was not a success, close all connections and quit the program
-            print("Failed response. Closing all connections and quitting.")
-            self.__close_all_connections()
-            time.sleep(3)
-            sys.exit()
+        return list(itertools.chain.from_iterable(self.__iter_api_pages(api_suffix, revalidate)))
 
     def __get_course_info(self) -> JSONType:
         """
@@ -138,71 +499,207 @@ class CanvasAPIInterface:
 
         :return: A json of course data if the api request was a success
         """
-        return self.__request_api_data("courses.json?enrollment_state=active")
+        return self.__request_api_data(COURSES_API_SUFFIX)
 
-    def __get_course_assignments(self, course_id: int) -> JSONType:
+    def __get_course_assignments(self, course_id: int) -> Iterator[JSONType]:
         """
-        Get information on all assignments for a given course ID.
+        Lazily get information on all assignments for a given course ID, one page at a time.
+        In incremental fetch mode, only the configured assignment buckets are requested and only assignments updated
+        since the course was last synced are returned.
 
         :param: The ID of the course whose assignments are of interest
-        :return: A json of assignment information if the api request was a success
+        :return: An iterator over the json of each assignment
+        """
+        self.__fetched_course_ids.add(course_id)
+        if not self.__incremental_fetch["enabled"]:
+            api_suffix, = assignment_api_suffixes(course_id, self.__incremental_fetch)
+            return itertools.chain.from_iterable(self.__iter_api_pages(api_suffix))
+        return self.__get_updated_course_assignments(course_id)
+
+    def __get_updated_course_assignments(self, course_id: int) -> Iterator[JSONType]:
+        """
+        Lazily get the assignments of a course in the configured buckets, ordered by due date, that have been updated
+        since the course was last synced. Every assignment is returned for a course that has never been synced.
+
+        :param course_id: The ID of the course whose assignments are of interest
+        :return: An iterator over the json of each updated assignment
+        """
+        last_synced_at = self.__course_sync_timestamps.get(course_id)
+        seen_ids = set()
+        for api_suffix in assignment_api_suffixes(course_id, self.__incremental_fetch):
+            pages = self.__iter_api_pages(api_suffix)
+            for assignment in itertools.chain.from_iterable(pages):
+                # An assignment can be in more than one bucket
+                if assignment["id"] in seen_ids:
+                    continue
+                seen_ids.add(assignment["id"])
+                if last_synced_at and assignment.get("updated_at") and \
+                        self.__parse_timestamp(assignment["updated_at"]) <= last_synced_at:
+                    continue
+                yield assignment
+
+    @staticmethod
+    def __parse_timestamp(timestamp: str) -> datetime:
         """
-        return self.__request_api_data(f"courses/{course_id}/assignments")
+        Parse a Canvas ISO 8601 timestamp.
 
-    def __get_course_assignment_groups(self, course_id: int) -> dict[int, str]:
+        :param timestamp: A timestamp such as "2022-07-01T11:59:00Z"
+        :return: A timezone aware datetime
+        """
+        return datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+
+    def __get_course_assignment_groups(self, course_id: int, revalidate: bool = False) -> dict[int, str]:
         """
         Get the assignment groups for a given course ID. From there, it returns a new
 
         :param course_id: The ID of the course whose assignment groups are of interest
+        :param revalidate: Whether to check with Canvas even if the cached groups are younger than their cache ttl
         :return: Dictionary with assignment group id as key, and the assignment type as the value
         """
-        assignment_groups = self.__request_api_data(f"courses/{course_id}/assignment_groups")
+        assignment_groups = self.__request_api_data(assignment_groups_api_suffix(course_id), revalidate)
         return {group["id"]: group["name"].strip() for group in assignment_groups}
 
-    def __extract_assignment_info(self, course_name: str, assignment_groups: dict[int, str],
-                                  assignment_json: JSONType) -> list[dict[str, int | str]]:
+    def __extract_assignment_info(self, course_id: int, course_name: str, assignment_groups: dict[int, str],
+                                  assignment_json: Iterable[JSONType]) -> list[Assignment]:
         """
         Extract the relevant pieces of information from an assignment json.
         The relevant pieces of information will be used in the creation of the Notion calendar pages.
+        Each assignment is also added to the checkpoint journal. The assignment groups are fetched again if an
+        assignment belongs to a group that was created since they were cached.
 
+        :param course_id: The ID of the course
         :param course_name: Name of the course
         :param: assignment_groups: Dictionary with assignment group id as key, and the assignment type as the value
-        :param assignment_json: The json of all assignments for the given course
-        :return: A list containing assignment dictionaries for a given course.
-        Each dictionary will be for a single assignment with the relevant pieces of information
+        :param assignment_json: The json of all assignments for the given course. This may be a lazy iterator
+        :return: A list containing an assignment record for each assignment of the given course
         """
         useful_keys = self.__config["relevant_assignment_keys"]
-        return [
-            {"course_name": course_name} | {"assignment_type": assignment_groups[assignment["assignment_group_id"]]} | {
-                key: assignment.get(key)
-                for key in useful_keys}
-            for assignment in assignment_json]
+        assignments = []
+        groups_revalidated = False
+        for assignment in assignment_json:
+            # Drop assignments outside the due date window before their descriptions are kept anywhere
+            if not self.__due_date_window.contains(assignment.get("due_at")):
+                continue
+            group_id = assignment["assignment_group_id"]
+            if group_id not in assignment_groups and not groups_revalidated:
+                assignment_groups = self.__get_course_assignment_groups(course_id, revalidate=True)
+                groups_revalidated = True
+            assignment_type = assignment_groups.get(group_id, "Unknown")
+            fields = {key: assignment.get(key) for key in useful_keys}
+            self.__checkpoint.record_assignment(course_id, assignment_type, fields)
+            assignments.append(self.__create_assignment(course_name, assignment_type, fields))
+        return assignments
+
+    def __create_assignment(self, course_name: str, assignment_type: str, fields: dict[str, Any]) -> Assignment:
+        """
+        Create a classified assignment record.
 
-    def __extract_all_assignment_info(self, courses: JSONType) -> list[dict[str, str | int]]:
+        :param course_name: Name of the course
+        :param assignment_type: The name of the assignment group the assignment belongs to
+        :param fields: The relevant keys of the Canvas assignment json
+        :return: The assignment record
         """
-        Extract assignment information from all courses.
+        category = self.__classifier.classify(assignment_type, fields.get("name"))
+        return Assignment(course_name, assignment_type, fields, self.__description_spool,
+                          self.__config["description_spool_threshold"], category)
+
+    def __extract_course_assignments(self, course: JSONType,
+                                     group_future: Future[dict[int, str]]) -> list[Assignment]:
+        """
+        Extract assignment information from a single course. Assignments are streamed page by page so only the
+        relevant pieces of information from each page are kept in memory.
+
+        :param course: A json containing course information for the course
+        :param group_future: A future that resolves to the assignment groups of the course
+        :return: A list containing assignment records for the course
+        """
+        course_name = course["course_code"]
+        print(f"Grabbing assignment data for {course_name}")
+        assignment_json = self.__get_course_assignments(course["id"])
+        assignments = self.__extract_assignment_info(course["id"], course_name, group_future.result(), assignment_json)
+        self.__checkpoint.complete_course(course["id"])
+        return assignments
+
+    def __resume_course_assignments(self, course: JSONType) -> list[Assignment]:
+        """
+        Recreate the assignments of a course that was fetched by an earlier run from the checkpoint journal.
+
+        :param course: A json containing course information for the course
+        :return: A list containing assignment records for the course
+        """
+        course_name = course["course_code"]
+        print(f"Resuming {course_name} from the checkpoint")
+        self.__resumed_course_ids.add(course["id"])
+        return [self.__create_assignment(course_name, assignment_type, fields)
+                for assignment_type, fields in self.__resumed_courses[course["id"]]
+                if self.__due_date_window.contains(fields.get("due_at"))]
+
+    def __filter_valid_courses(self, courses: JSONType) -> list[JSONType]:
+        """
+        Remove the courses whose name does not match the course name pattern in the config.
 
         :param courses: A json containing course information for all currently enrolled courses
-        :return: A list containing assignment dictionaries for all courses.
-        Each dictionary will be for a single assignment with the relevant pieces of information
+        :return: A list of the courses with a valid name
         """
-        assignments = []
+        valid_courses = []
         for course in courses:
             course_name = course["course_code"]
-            print(f"Grabbing assignment data for {course_name}")
             # Check if the course name matches a given pattern
-            if not re.match(self.__config["course_name_regex"], course_name):
+            if not self.__course_name_pattern.match(course_name):
                 print(f"{course_name} is not a valid course. Skipping.")
-                time.sleep(4)
                 continue
-            assignment_json = self.__get_course_assignments(course["id"])
-            time.sleep(2)  # Sleep to prevent too many api calls too quickly
-            assignment_groups = self.__get_course_assignment_groups(course["id"])
-            assignment_info = self.__extract_assignment_info(course_name, assignment_groups, assignment_json)
-            assignments.append(assignment_info)
-            time.sleep(2.5)  # Sleep to prevent too many api calls too quickly
+            valid_courses.append(course)
+        return valid_courses
+
+    def __iter_all_assignment_info(self, courses: JSONType) -> Iterator[list[Assignment]]:
+        """
+        Extract assignment information from all courses, yielding the assignments of each course as soon as they
+        have been fetched. The assignments and assignment groups of every course are requested concurrently, with
+        the shared rate limiter keeping the requests within the Canvas API limits.
+
+        :param courses: A json containing course information for all currently enrolled courses
+        :return: An iterator over lists of assignment records, one list per course
+        """
+        valid_courses = []
+        for course in self.__filter_valid_courses(courses):
+            if course["id"] in self.__resumed_courses:
+                yield self.__resume_course_assignments(course)
+            else:
+                valid_courses.append(course)
+        executor = ThreadPoolExecutor(max_workers=self.__config["max_concurrent_requests"])
+        try:
+            # Every assignment group request is queued before any assignment request. This guarantees the group
+            # requests are already running when the assignment tasks wait on them, so the pool cannot deadlock.
+            group_futures = [executor.submit(self.__get_course_assignment_groups, course["id"])
+                             for course in valid_courses]
+            assignment_futures = [
+                executor.submit(self.__extract_course_assignments, course, group_future)
+                for course, group_future in zip(valid_courses, group_futures)
+            ]
+            for assignment_future in as_completed(assignment_futures):
+                yield assignment_future.result()
+        finally:
+            # If the caller stops early or a course fails, the courses that have not started are dropped rather than
+            # fetched for nobody
+            executor.shutdown(cancel_futures=True)
+
+    def __extract_all_assignment_info(self, courses: JSONType,
+                                      on_course_fetched: Callable[[list[Assignment]], None] | None = None
+                                      ) -> list[Assignment]:
+        """
+        Extract assignment information from all courses.
+
+        :param courses: A json containing course information for all currently enrolled courses
+        :param on_course_fetched: Called with the assignments of each course as soon as the course has been fetched
+        :return: A list containing assignment records for all courses
+        """
+        assignments = []
+        for course_assignments in self.__iter_all_assignment_info(courses):
+            if on_course_fetched is not None:
+                on_course_fetched(course_assignments)
+            assignments.append(course_assignments)
         print()
-        # Unpack all the different assignments into just one list of dictionaries
+        # Unpack all the different assignments into just one list
         return list(itertools.chain(*assignments))
 
     def __close_all_connections(self) -> None:
@@ -211,31 +708,141 @@ class CanvasAPIInterface:
 
         :return: None
         """
+        if self.__shared_http_adapter:
+            # Closing the session closes its adapters, which would drop the connections of every other user of them
+            self.__session.adapters.clear()
         self.__session.close()
-        self.__driver.close()
+        self.__quit_browser()
         print("All connections closed!")
 
     @property
-    def assignments(self) -> list[dict[str, str | int]] | None:
+    def canvas_url(self) -> str:
+        """
+        Getter method that returns the url of the Canvas instance.
+
+        :return: The Canvas url, ending in a slash
+        """
+        return self.__canvas_url
+
+    @property
+    def watch_config(self) -> dict[str, float]:
+        """
+        Getter method that returns the watch mode section of the config file.
+
+        :return: A dictionary of watch mode settings
+        """
+        return self.__config["watch"]
+
+    @property
+    def assignments(self) -> list[Assignment] | None:
         """
         Getter method that returns the assignments list.
 
-        :return: A list containing assignment dictionaries for all courses if the run method has be executed otherwise
-        returns None. If the return is a list, each dictionary will be for a single assignment with the relevant pieces
-        of information
+        :return: A list containing assignment records for all courses if the run method has be executed otherwise
+        returns None
         """
         return self.__assignments
 
-    def run(self) -> None:
+    def run(self, on_course_fetched: Callable[[list[Assignment]], None] | None = None) -> None:
         """
         Method to run the whole assignment extraction pipeline. After the process is complete, the assignments that have
         been extracted will be stored as the instance variable "assignment"
 
+        :param on_course_fetched: Called with the assignments of each course as soon as the course has been fetched,
+        for example to start converting their descriptions while the other courses are fetched
+        :return: None
+        """
+        self.__authenticate()
+        self.__start_fetch(resumable=True)
+        try:
+            courses = self.__get_course_info()
+            self.__assignments = self.__extract_all_assignment_info(courses, on_course_fetched)
+            self.__checkpoint.finish()
+        finally:
+            self.__checkpoint.close()
+            self.__close_all_connections()
+
+    def __start_fetch(self, resumable: bool = False) -> None:
+        """
+        Record the start of a fetch, which is used by mark_sync_complete. A resumable fetch continues from the
+        checkpoint journal of an earlier fetch that was interrupted, and journals its own progress.
+
+        :param resumable: Whether to use the checkpoint journal
+        :return: None
+        """
+        self.__fetch_started_at = datetime.now(timezone.utc)
+        self.__fetched_course_ids = set()
+        self.__resumed_course_ids = set()
+        window_config = due_date_window_config(self.__config["due_date_window"], self.__incremental_fetch)
+        self.__due_date_window = DueDateWindow(window_config, self.__fetch_started_at)
+        self.__resumed_courses = self.__checkpoint.open() if resumable else {}
+        # Resumed courses hold what Canvas returned when the journal was started, not when this fetch started
+        self.__resumed_fetch_started_at = self.__checkpoint.started_at if resumable else None
+
+    def get_courses(self) -> list[JSONType]:
+        """
+        Get the currently enrolled courses whose name matches the course name pattern in the config. The session is
+        authenticated first if it has not been already, and is kept open afterwards.
+
+        :return: A list of course jsons
+        """
+        self.__authenticate()
+        return self.__filter_valid_courses(self.__get_course_info())
+
+    def fetch_assignments(self, courses: list[JSONType]) -> list[Assignment]:
+        """
+        Fetch the assignments of a set of courses without closing the session, so that it can be reused by later
+        fetches. Use close once no more fetches are needed.
+
+        :param courses: A list of course jsons, as returned by get_courses
+        :return: A list containing assignment records for the given courses
+        """
+        self.__authenticate()
+        self.__start_fetch()
+        return self.__extract_all_assignment_info(courses)
+
+    def close(self) -> None:
+        """
+        Close the request session and headless browser.
+
         :return: None
         """
-        self.__get_canvas_login()
-        self.__canvas_login()
-        self.__transfer_cookies()
-        courses = self.__get_course_info()
-        self.__assignments = self.__extract_all_assignment_info(courses)
         self.__close_all_connections()
+
+    def mark_sync_complete(self) -> None:
+        """
+        Record that every course fetched by the last run has been synced successfully, so that the next incremental
+        fetch only returns assignments updated after this run started, and delete the checkpoint journal of the run.
+        Courses resumed from the journal are recorded as of the start of the run that journaled them.
+        This should only be called once every assignment has been written, otherwise failed assignments would be
+        skipped by later runs.
+
+        :return: None
+        """
+        self.__checkpoint.clear()
+        if not self.__fetch_started_at:
+            return
+        # Step back slightly so updates made while the run was starting are not missed
+        clock_skew_margin = timedelta(seconds=self.__incremental_fetch["clock_skew_margin"])
+        self.__course_sync_timestamps.save(self.__fetched_course_ids, self.__fetch_started_at - clock_skew_margin)
+        if self.__resumed_course_ids:
+            self.__course_sync_timestamps.save(self.__resumed_course_ids,
+                                               self.__resumed_fetch_started_at - clock_skew_margin)
+
+    def stream(self) -> Iterator[Assignment]:
+        """
+        Method to run the assignment extraction pipeline lazily. Assignments are yielded course by course as soon as
+        each course has been fetched, rather than being stored in the instance variable "assignment".
+
+        :return: An iterator over assignment records for all courses
+        """
+        self.__authenticate()
+        self.__start_fetch(resumable=True)
+        try:
+            courses = self.__get_course_info()
+            for course_assignments in self.__iter_all_assignment_info(courses):
+                yield from course_assignments
+            self.__checkpoint.finish()
+        finally:
+            self.__checkpoint.close()
+            self.__close_all_connections()
@@ -1,21 +1,71 @@
 from html.parser import HTMLParser
-from collections import deque
+from collections import deque, OrderedDict
+import hashlib
 import json
+import time
+
+from src.instrumentation import metrics
 
 
 class CanvasToNotionHTMLParser(HTMLParser):
-    def __init__(self):
+    def __init__(self, cache_size: int = 256):
+        """
+        :param cache_size: The maximum number of converted descriptions to remember
+        """
+        self.__block_tags = frozenset({"p", "h1", "h2", "h3", "h4", "h5", "h6", "li"})
+        self.__inline_tags = frozenset({"a", "strong", "em"})
+        self.__list_tags = {"ul": "bulleted_list_item", "ol": "numbered_list_item"}
+        self.__known_tags = self.__block_tags | self.__inline_tags | self.__list_tags.keys()
+        self.__ignore_tags = frozenset({"div", "span", "br"})
+        self.__cache_size = cache_size
+        self.__cache = OrderedDict()
+        self.last_parse_duration = None
         HTMLParser.__init__(self)
-        self.__block_tags = {"p", "h1", "h2", "h3", "h4", "h5", "h6", "li"}
-        self.__inline_tags = {"a", "strong", "em"}
-        self.__ignore_tags = ("div", "span", "br")
+
+    def reset(self):
+        """
+        Reset the parser so that no state is carried over from a previous document.
+        """
+        HTMLParser.reset(self)
         self.__tag_stack = deque()
         self.__output = []
         self.__latest_block = None
         self.__latest_text_type = None
+        self.__latest_list_type = None
         self.__latest_url = None
         self.__unknown_tag = False
 
+    def convert(self, html: str) -> list[dict]:
+        """
+        Convert a Canvas HTML document into a list of Notion blocks. Results are remembered by a hash of the document,
+        so repeated documents are only parsed once. The returned list is shared between calls with the same document
+        and must not be modified. The time taken is stored in last_parse_duration, which is None for cached documents.
+
+        :param html: The HTML document to convert
+        :return: A list of Notion blocks
+        """
+        key = hashlib.blake2b(html.encode("utf-8"), digest_size=16).digest()
+        blocks = self.__cache.get(key)
+        if blocks is not None:
+            self.__cache.move_to_end(key)
+            self.last_parse_duration = None
+            metrics.record_parse(None)
+            return blocks
+
+        start = time.perf_counter()
+        self.reset()
+        self.feed(html)
+        self.close()
+        blocks = self.parsed_content
+        self.reset()
+        self.last_parse_duration = time.perf_counter() - start
+        metrics.record_parse(self.last_parse_duration)
+
+        self.__cache[key] = blocks
+        if len(self.__cache) > self.__cache_size:
+            self.__cache.popitem(last=False)
+        return blocks
+
     def handle_starttag(self, tag, attrs):
         if tag == "a":
             for name, value in attrs:
@@ -26,7 +76,7 @@ class CanvasToNotionHTMLParser(HTMLParser):
         if tag in self.__ignore_tags:
             return
 
-        if tag not in self.__block_tags | self.__inline_tags:
+        if tag not in self.__known_tags:
             self.__unknown_tag = True
             self.__output.append(
                 {
@@ -50,12 +100,8 @@ class CanvasToNotionHTMLParser(HTMLParser):
             )
             return
 
-        if tag in ("ul", "ol"):
-            self.__latest_text_type = (
-                "bulleted_list_item"
-                if self.__latest_text_type == "ul"
-                else "numbered_list_item"
-            )
+        if tag in self.__list_tags:
+            self.__latest_list_type = self.__list_tags[tag]
 
         if tag in self.__block_tags:
             match tag:
@@ -63,6 +109,8 @@ class CanvasToNotionHTMLParser(HTMLParser):
                     self.__latest_text_type = f"heading_{tag[-1]}"
                 case "p":
                     self.__latest_text_type = "paragraph"
+                case "li":
+                    self.__latest_text_type = self.__latest_list_type or "bulleted_list_item"
                 case _:
                     self.__latest_text_type = tag
             self.__new_block_data(self.__latest_text_type)
@@ -77,6 +125,7 @@ class CanvasToNotionHTMLParser(HTMLParser):
             case "a":
                 self.__convert_latest_rich_text_to_url()
             case "ul" | "ol":
+                self.__latest_list_type = None
                 self.__latest_text_type = None
         if self.__latest_block and tag in self.__block_tags:
             self.__output.append(self.__latest_block)
@@ -84,7 +133,7 @@ class CanvasToNotionHTMLParser(HTMLParser):
             self.__latest_text_type = None
 
     def handle_data(self, data):
-        if not self.__latest_text_type or self.__unknown_tag:
+        if not self.__latest_text_type or not self.__latest_block or self.__unknown_tag:
             return
         self.__append_data_to_block(data)
 
@@ -124,29 +173,35 @@ class CanvasToNotionHTMLParser(HTMLParser):
         }
 
     def __append_data_to_block(self, data):
-        print(data)
         latest_block_type = self.__latest_block.get("type")
         rich_text_list = self.__latest_block[latest_block_type]["rich_text"]
         rich_text_list.append({"type": "text", "text": {"content": data}})
 
-    def __convert_latest_rich_text_to_bold(self):
+    def __get_latest_rich_text(self):
+        if not self.__latest_block:
+            return None
         latest_block_type = self.__latest_block.get("type")
-        latest_rich_text = self.__latest_block[latest_block_type]["rich_text"][-1]
-        latest_rich_text["annotations"] = latest_rich_text.get(
-            "annotations", dict()
-        ) | {"bold": True}
+        rich_text_list = self.__latest_block[latest_block_type]["rich_text"]
+        return rich_text_list[-1] if rich_text_list else None
+
+    def __convert_latest_rich_text_to_bold(self):
+        latest_rich_text = self.__get_latest_rich_text()
+        if latest_rich_text:
+            latest_rich_text["annotations"] = latest_rich_text.get(
+                "annotations", dict()
+            ) | {"bold": True}
 
     def __convert_latest_rich_text_to_italics(self):
-        latest_block_type = self.__latest_block.get("type")
-        latest_rich_text = self.__latest_block[latest_block_type]["rich_text"][-1]
-        latest_rich_text["annotations"] = latest_rich_text.get(
-            "annotations", dict()
-        ) | {"italic": True}
+        latest_rich_text = self.__get_latest_rich_text()
+        if latest_rich_text:
+            latest_rich_text["annotations"] = latest_rich_text.get(
+                "annotations", dict()
+            ) | {"italic": True}
 
     def __convert_latest_rich_text_to_url(self):
-        latest_block_type = self.__latest_block.get("type")
-        latest_rich_text = self.__latest_block[latest_block_type]["rich_text"][-1]
-        latest_rich_text["text"]["link"] = {"url": self.__latest_url}
+        latest_rich_text = self.__get_latest_rich_text()
+        if latest_rich_text:
+            latest_rich_text["text"]["link"] = {"url": self.__latest_url}
 
     def __inline_data(self, data):
         latest_block_type = self.__latest_block.get("type")
@@ -0,0 +1,70 @@
+from __future__ import annotations
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+
+class AssignmentClassifier:
+    """
+    Classifies assignments by the keywords in their assignment group and name. The keywords of every type are
+    combined into a single precompiled regex, so each assignment is scanned once rather than once per type.
+    """
+
+    def __init__(self, type_keywords: dict[str, list[str]], default_type: str = "Unknown"):
+        """
+        :param type_keywords: A dictionary with the type as the key and the keywords that identify it as the value.
+        When an assignment matches more than one type, the type listed first wins
+        :param default_type: The type of assignments that match no keywords
+        """
+        self.__types = list(type_keywords)
+        self.__default_type = default_type
+        # One named group per type, so the type of a match can be found from the group that matched
+        self.__pattern = re.compile("|".join(
+            f"(?P<t{index}>{'|'.join(re.escape(keyword) for keyword in keywords)})"
+            for index, keywords in enumerate(type_keywords.values()) if keywords
+        ) or "(?!)", re.IGNORECASE)
+        self.__group_indices = {f"t{index}": index for index in range(len(self.__types))}
+
+    def classify(self, assignment_group: str, name: str | None) -> str:
+        """
+        :param assignment_group: The name of the assignment group the assignment belongs to
+        :param name: The name of the assignment
+        :return: The type of the assignment
+        """
+        best = None
+        for match in self.__pattern.finditer(f"{assignment_group}\n{name or ''}"):
+            index = self.__group_indices[match.lastgroup]
+            if best is None or index < best:
+                best = index
+                if best == 0:
+                    break
+        return self.__types[best] if best is not None else self.__default_type
+
+
+class DueDateWindow:
+    """
+    Keeps only the assignments due within a window around the current time. Either side of the window can be left
+    open.
+    """
+
+    def __init__(self, window_config: dict[str, Any], now: datetime | None = None):
+        """
+        :param window_config: The due date window section of the config file
+        :param now: The time the window is centred on. Defaults to the current time
+        """
+        now = now or datetime.now(timezone.utc)
+        past_days = window_config["past_days"]
+        future_days = window_config["future_days"]
+        self.__earliest = now - timedelta(days=past_days) if past_days is not None else None
+        self.__latest = now + timedelta(days=future_days) if future_days is not None else None
+        self.__include_undated = window_config["include_undated"]
+
+    def contains(self, due_at: str | None) -> bool:
+        """
+        :param due_at: The due date of an assignment as an ISO 8601 timestamp, if it has one
+        :return: Whether the assignment should be kept
+        """
+        if not due_at:
+            return self.__include_undated
+        due = datetime.fromisoformat(due_at.replace("Z", "+00:00"))
+        return (self.__earliest is None or due >= self.__earliest) and (self.__latest is None or due <= self.__latest)
@@ -0,0 +1,129 @@
+from __future__ import annotations
+import hashlib
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, Future
+
+from src.canvas_html_parser import CanvasToNotionHTMLParser
+from src.instrumentation import metrics
+
+# Each worker process keeps its own parser so that its conversion cache is reused across descriptions
+_worker_parser = None
+
+
+def _convert_in_worker(html: str) -> tuple[list[dict], float | None]:
+    """
+    Convert a description inside a worker process.
+
+    :param html: The HTML description to convert
+    :return: A tuple of the list of Notion blocks and the time taken to parse them, which is None if the worker had
+    already converted the description
+    """
+    global _worker_parser
+    if _worker_parser is None:
+        _worker_parser = CanvasToNotionHTMLParser()
+    blocks = _worker_parser.convert(html)
+    return blocks, _worker_parser.last_parse_duration
+
+
+class DescriptionConverter:
+    """
+    Converts assignment descriptions into Notion blocks across a pool of processes. Descriptions can be queued
+    ahead of time with prefetch so that they are converted while other work is happening, and identical descriptions
+    are only converted once. Provides the same convert method as CanvasToNotionHTMLParser, so either can be used to
+    build page payloads. A converter is thread safe and can be shared between several Notion interfaces.
+    """
+
+    def __init__(self, processes: int, max_entries: int = 4096):
+        """
+        :param processes: The number of worker processes to use. If this is 0, descriptions are converted in the
+        current process instead
+        :param max_entries: The maximum number of converted descriptions to remember
+        """
+        self.__executor = None
+        if processes:
+            # Workers are spawned rather than forked, since a fork taken while another thread holds a lock, such as
+            # the metrics lock, leaves the worker waiting on that lock forever
+            self.__executor = ProcessPoolExecutor(max_workers=processes,
+                                                  mp_context=multiprocessing.get_context("spawn"))
+        self.__parser = None if processes else CanvasToNotionHTMLParser(cache_size=max_entries)
+        self.__max_entries = max_entries
+        self.__pending = OrderedDict()
+        self.__recorded = set()
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def __description_key(html: str) -> bytes:
+        """
+        Create a key that identifies a description.
+
+        :param html: The HTML description
+        :return: A hash of the description
+        """
+        return hashlib.blake2b(html.encode("utf-8"), digest_size=16).digest()
+
+    def __submit(self, key: bytes, html: str) -> Future[tuple[list[dict], float | None]]:
+        """
+        Get the conversion of a description, queueing it if it has not been converted already. The least recently
+        used conversions are forgotten once there are more than max_entries. Must be called with the lock held.
+
+        :param key: The key of the description
+        :param html: The HTML description to convert
+        :return: A future that resolves to the converted blocks and the time taken to parse them
+        """
+        future = self.__pending.get(key)
+        if future is not None:
+            self.__pending.move_to_end(key)
+            return future
+        future = self.__pending[key] = self.__executor.submit(_convert_in_worker, html)
+        if len(self.__pending) > self.__max_entries:
+            evicted_key, _ = self.__pending.popitem(last=False)
+            self.__recorded.discard(evicted_key)
+        return future
+
+    def prefetch(self, html: str | None) -> None:
+        """
+        Queue a description to be converted in the background.
+
+        :param html: The HTML description to convert
+        :return: None
+        """
+        if not html or not self.__executor:
+            return
+        key = self.__description_key(html)
+        with self.__lock:
+            self.__submit(key, html)
+
+    def convert(self, html: str) -> list[dict]:
+        """
+        Get the Notion blocks of a description, waiting for its conversion if it is still in progress.
+
+        :param html: The HTML description to convert
+        :return: A list of Notion blocks
+        """
+        if not self.__executor:
+            with self.__lock:
+                return self.__parser.convert(html)
+        key = self.__description_key(html)
+        with self.__lock:
+            future = self.__submit(key, html)
+        blocks, parse_duration = future.result()
+        # Worker processes cannot record metrics for this process, so each conversion is recorded the first time
+        # its result is used and any later use counts as a cache hit
+        with self.__lock:
+            first_use = key not in self.__recorded
+            self.__recorded.add(key)
+        metrics.record_parse(parse_duration if first_use else None)
+        return blocks
+
+    def close(self) -> None:
+        """
+        Shut down the worker processes.
+
+        :return: None
+        """
+        if self.__executor:
+            self.__executor.shutdown()
+        self.__pending.clear()
+        self.__recorded.clear()
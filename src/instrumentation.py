@@ -0,0 +1,189 @@
+from __future__ import annotations
+import json
+import time
+import threading
+import statistics
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+
+class SyncMetrics:
+    """
+    Thread safe collector of timings for a sync run: how long each stage took, every API request with its status
+    code, retries, time spent sleeping and how long each description took to parse.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Discard everything that has been recorded.
+
+        :return: None
+        """
+        with self.__lock:
+            self.__stages = {}
+            self.__requests = defaultdict(list)
+            self.__statuses = defaultdict(lambda: defaultdict(int))
+            self.__retries = defaultdict(int)
+            self.__sleeps = defaultdict(list)
+            self.__parse_durations = []
+            self.__parse_cache_hits = 0
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time a stage of the run. Repeated stages with the same name are added together.
+
+        :param name: The name of the stage
+        :return: A context manager that times its body
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            with self.__lock:
+                self.__stages[name] = self.__stages.get(name, 0) + duration
+
+    def record_request(self, service: str, status_code: int | None, duration: float) -> None:
+        """
+        :param service: The API the request was sent to, e.g. "canvas" or "notion"
+        :param status_code: The status code of the response, or None if no response was received
+        :param duration: The number of seconds the request took
+        :return: None
+        """
+        with self.__lock:
+            self.__requests[service].append(duration)
+            self.__statuses[service][str(status_code)] += 1
+
+    def record_retry(self, service: str) -> None:
+        """
+        :param service: The API the retried request was sent to
+        :return: None
+        """
+        with self.__lock:
+            self.__retries[service] += 1
+
+    def record_sleep(self, service: str, duration: float) -> None:
+        """
+        :param service: The API the sleep was waiting on
+        :param duration: The number of seconds slept
+        :return: None
+        """
+        if duration <= 0:
+            return
+        with self.__lock:
+            self.__sleeps[service].append(duration)
+
+    def record_parse(self, duration: float | None) -> None:
+        """
+        :param duration: The number of seconds a description took to parse, or None if it came from the cache
+        :return: None
+        """
+        with self.__lock:
+            if duration is None:
+                self.__parse_cache_hits += 1
+            else:
+                self.__parse_durations.append(duration)
+
+    @staticmethod
+    def __describe(durations: list[float]) -> dict[str, float | int]:
+        """
+        Summarise a list of durations.
+
+        :param durations: A list of durations in seconds
+        :return: The count, total and percentiles of the durations
+        """
+        summary = {"count": len(durations), "total_seconds": sum(durations)}
+        if len(durations) > 1:
+            cuts = statistics.quantiles(durations, n=100, method="inclusive")
+            summary |= {"p50_seconds": cuts[49], "p90_seconds": cuts[89], "p99_seconds": cuts[98]}
+        if durations:
+            summary["max_seconds"] = max(durations)
+        return summary
+
+    def summary(self) -> dict[str, Any]:
+        """
+        Summarise everything that has been recorded.
+
+        :return: A json serialisable dictionary of the recorded metrics
+        """
+        with self.__lock:
+            return {
+                "stages": dict(self.__stages),
+                "requests": {service: self.__describe(durations) | {"statuses": dict(self.__statuses[service])}
+                             for service, durations in self.__requests.items()},
+                "retries": dict(self.__retries),
+                "sleeps": {service: self.__describe(durations) for service, durations in self.__sleeps.items()},
+                "parsing": self.__describe(self.__parse_durations) | {"cache_hits": self.__parse_cache_hits},
+            }
+
+    def format_report(self) -> str:
+        """
+        Format the recorded metrics as a human-readable report.
+
+        :return: The report
+        """
+        summary = self.summary()
+        lines = ["Sync timing report"]
+        for name, duration in summary["stages"].items():
+            lines.append(f"  stage {name:<22} {duration:8.2f}s")
+        for service, requests in summary["requests"].items():
+            statuses = ", ".join(f"{status}: {count}" for status, count in requests["statuses"].items())
+            lines.append(f"  {service} requests: {requests['count']} ({statuses}), "
+                         f"p50 {requests.get('p50_seconds', requests['total_seconds']) * 1000:.0f}ms, "
+                         f"p99 {requests.get('p99_seconds', requests['total_seconds']) * 1000:.0f}ms, "
+                         f"retries: {summary['retries'].get(service, 0)}")
+        for service, sleeps in summary["sleeps"].items():
+            lines.append(f"  {service} sleeps: {sleeps['count']} totalling {sleeps['total_seconds']:.2f}s")
+        parsing = summary["parsing"]
+        lines.append(f"  descriptions parsed: {parsing['count']} in {parsing['total_seconds']:.2f}s, "
+                     f"cache hits: {parsing['cache_hits']}")
+        return "\n".join(lines)
+
+    def to_json(self) -> str:
+        """
+        :return: The recorded metrics as a json document
+        """
+        return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self, prefix: str = "canvas_notion") -> str:
+        """
+        Format the recorded metrics in the Prometheus text exposition format.
+
+        :param prefix: The prefix of every metric name
+        :return: The metrics in Prometheus text format
+        """
+        summary = self.summary()
+        lines = [f"# TYPE {prefix}_stage_seconds gauge"]
+        lines += [f'{prefix}_stage_seconds{{stage="{name}"}} {duration}'
+                  for name, duration in summary["stages"].items()]
+        lines += [f"# TYPE {prefix}_requests_total counter"]
+        for service, requests in summary["requests"].items():
+            lines += [f'{prefix}_requests_total{{service="{service}",status="{status}"}} {count}'
+                      for status, count in requests["statuses"].items()]
+        lines += [f"# TYPE {prefix}_request_seconds_total counter"]
+        lines += [f'{prefix}_request_seconds_total{{service="{service}"}} {requests["total_seconds"]}'
+                  for service, requests in summary["requests"].items()]
+        lines += [f"# TYPE {prefix}_retries_total counter"]
+        lines += [f'{prefix}_retries_total{{service="{service}"}} {count}'
+                  for service, count in summary["retries"].items()]
+        lines += [f"# TYPE {prefix}_sleep_seconds_total counter"]
+        lines += [f'{prefix}_sleep_seconds_total{{service="{service}"}} {sleeps["total_seconds"]}'
+                  for service, sleeps in summary["sleeps"].items()]
+        parsing = summary["parsing"]
+        lines += [f"# TYPE {prefix}_parse_seconds_total counter",
+                  f"{prefix}_parse_seconds_total {parsing['total_seconds']}",
+                  f"# TYPE {prefix}_parsed_descriptions_total counter",
+                  f"{prefix}_parsed_descriptions_total {parsing['count']}",
+                  f"# TYPE {prefix}_parse_cache_hits_total counter",
+                  f"{prefix}_parse_cache_hits_total {parsing['cache_hits']}"]
+        return "\n".join(lines) + "\n"
+
+
+# Shared collector used by every interface in this process
+metrics = SyncMetrics()
@@ -1,53 +1,83 @@
+from __future__ import annotations
 import os
-import requests
-import time
+import json
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+from typing import Iterable
 
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
-from src.canvas_html_parser import CanvasToNotionHTMLParser
+from src.assignment import Assignment
+from src.description_converter import DescriptionConverter
+from src.notion_index import NotionDatabaseIndex
+from src.notion_writer import NotionPageWriter, WriteResult
+from src.rate_limiter import TokenBucketRateLimiter
+from src.sync_state import SyncStateIndex
 
 load_dotenv()
 
 
 class NotionAPIInterface:
-    def __init__(self):
-        self.__API_BASE_URL = "https://api.notion.com/v1/pages"
-        self.__DATABASE_ID = os.getenv("NOTION_DATABASE_ID")
+    def __init__(self, config_path: str = "config/notion.json", notion_key: str | None = None,
+                 database_id: str | None = None, rate_limiter: TokenBucketRateLimiter | None = None,
+                 http_adapter: HTTPAdapter | None = None, converter: DescriptionConverter | None = None,
+                 use_environment_credentials: bool = True):
+        """
+        :param config_path: The path of the config file to load
+        :param notion_key: The Notion integration key. Defaults to the NOTION_KEY environment variable
+        :param database_id: The id of the Notion database. Defaults to the NOTION_DATABASE_ID environment variable
+        :param rate_limiter: A rate limiter shared with other interfaces. Defaults to one created from the config
+        :param http_adapter: A connection pool shared with other interfaces. Defaults to a pool for this interface only
+        :param converter: A description converter shared with other interfaces. Defaults to one created from the
+        config for each sync
+        :param use_environment_credentials: Whether to fall back to the NOTION_KEY and NOTION_DATABASE_ID environment
+        variables when no key or database id is given. Disable this when the interface belongs to one of several
+        accounts
+        """
+        # Load the config file
+        with open(config_path) as cfg:
+            self.__config = json.load(cfg)
+        self.__API_BASE_URL = f"{self.__config['api_base_url']}pages"
+        if use_environment_credentials:
+            database_id = database_id or os.getenv("NOTION_DATABASE_ID")
+            notion_key = notion_key or os.getenv("NOTION_KEY")
+        if not database_id or not notion_key:
+            raise ValueError("A Notion key and database id are needed to sync to Notion.")
+        self.__DATABASE_ID = database_id
+        self.__notion_key = notion_key
+        self.__rate_limiter = rate_limiter
+        self.__http_adapter = http_adapter
+        self.__converter = converter
+        # The converter created by prefetch_descriptions when none is shared, which the next sync uses and closes
+        self.__own_converter = None
+        self.__lazy_descriptions = self.__config["lazy_descriptions"]
         self.__assignments = None
 
     @property
-    def assignments(self) -> list[dict[str, str | int]] | None:
+    def assignments(self) -> list[Assignment] | None:
         """
         Getter method that returns the assignments list.
 
-        :return: A list containing assignment dictionaries for all courses if the run method has be executed otherwise
-        returns None. If the return is a list, each dictionary will be for a single assignment with the relevant pieces
-        of information
+        :return: A list containing assignment records for all courses if they have been set otherwise returns None
         """
         return self.__assignments
 
     @assignments.setter
-    def assignments(self, assignments_list: list[dict[str, str | int]]):
+    def assignments(self, assignments_list: list[Assignment]):
         self.__assignments = assignments_list
 
     @staticmethod
     def __get_assignment_types(assignment):
-        types = [{"name": "Deadline"}]
-
-        valid_types = ("quiz", "test", "tutorial", "lab", "assignment", "exam")
-        for assignment_type in valid_types:
-            if assignment_type in assignment["assignment_type"].lower() or assignment["name"].lower():
-                types.append({"name": assignment_type.title()})
-                break
-        else:
-            types.append({"name": "Unknown"})
-        return types
+        # Assignments are classified as they are fetched from Canvas
+        return [{"name": "Deadline"}, {"name": assignment.category}]
 
     def create_payload_json(self, title: str, date: str, assignment_url: str = None, course_name: str = "test",
-                            assignment_types: list[dict[str, str]] = None, assignment_description: str = None, parser = None):
+                            assignment_types: list[dict[str, str]] = None, assignment_description: str = None,
+                            parser=None):
         if assignment_description:
-            parser.feed(assignment_description)
-            parsed_description = parser.parsed_content
+            parsed_description = parser.convert(assignment_description)
         else:
             parsed_description = None
         return {
@@ -93,32 +123,330 @@ class NotionAPIInterface:
 
     def extract_assignment_information(self, assignment):
         assignment_types = self.__get_assignment_types(assignment)
-        return assignment.get("name"), assignment.get("due_at"), assignment.get("html_url"), \
-               assignment.get("course_name"), assignment_types, assignment.get("description")
+        return assignment.name, assignment.due_at, assignment.html_url, \
+               assignment.course_name, assignment_types, assignment.description
+
+    def __defers_body(self, assignment: Assignment) -> bool:
+        """
+        In lazy description mode, a new page is created without its body unless the assignment is due soon.
+
+        :param assignment: The assignment to check
+        :return: Whether the body of the assignment's page should be filled in later
+        """
+        if not self.__lazy_descriptions["enabled"] or not assignment.has_description:
+            return False
+        if not assignment.due_at:
+            return True
+        now = datetime.now(timezone.utc)
+        due_at = datetime.fromisoformat(assignment.due_at.replace("Z", "+00:00"))
+        return not now <= due_at <= now + timedelta(hours=self.__lazy_descriptions["eager_window_hours"])
 
-    def create_notion_page(self, assignment, headers, parser):
+    def create_notion_page(self, assignment, writer: NotionPageWriter, parser) -> Future[WriteResult]:
+        """
+        Queue the creation of a new Notion page for an assignment.
+
+        :param assignment: The assignment dictionary to create a page for
+        :param writer: The writer used to send the request
+        :param parser: The converter used to turn the assignment description into Notion blocks. If this is None, the
+        page is created without a body, which can be filled in later with fill_page_body
+        :return: A future that resolves to the result of the write
+        """
         assignment_information = self.extract_assignment_information(assignment)
+        if parser is None:
+            assignment_information = (*assignment_information[:-1], None)
         payload = self.create_payload_json(*assignment_information, parser)
 
-        print(f"{assignment_information[3]} - {assignment_information[0]}")
+        label = f"{assignment_information[3]} - {assignment_information[0]}"
+        print(label)
 
-        requests.post(self.__API_BASE_URL, json=payload, headers=headers)
-        time.sleep(0.7)
+        return writer.submit_page(self.__API_BASE_URL, payload, label)
 
-    def run(self):
-        if not self.__assignments:
-            print("No assignment data given. Use NotionAPIInterface.assignments = ... "
-                  "to pass in assignment data before running again.")
-            return
+    def update_notion_page(self, page_id: str, assignment, writer: NotionPageWriter,
+                           parser=None) -> Future[WriteResult]:
+        """
+        Queue an update of the properties of an existing Notion page with new assignment information, and optionally
+        replace the page body with the current description.
 
+        :param page_id: The id of the Notion page to update
+        :param assignment: The assignment dictionary with the new information
+        :param writer: The writer used to send the request
+        :param parser: The converter used to turn the assignment description into Notion blocks. If this is None, the
+        page body is left as it is
+        :return: A future that resolves to the result of the write
+        """
+        assignment_information = self.extract_assignment_information(assignment)
+        payload = {"properties": self.create_payload_json(*assignment_information[:-1])["properties"]}
+        children = None
+        if parser is not None:
+            description = assignment.description
+            children = parser.convert(description) if description else []
+
+        label = f"{assignment_information[3]} - {assignment_information[0]}"
+        print(f"Updating {label}")
+
+        return writer.submit_update(f"{self.__API_BASE_URL}/{page_id}", payload, page_id, children, label)
+
+    def fill_page_body(self, page_id: str, assignment, writer: NotionPageWriter, parser) -> Future[WriteResult]:
+        """
+        Queue the description of an assignment to be appended to a page that was created without it.
+
+        :param page_id: The id of the Notion page to fill in
+        :param assignment: The assignment whose description is the body of the page
+        :param writer: The writer used to send the request
+        :param parser: The converter used to turn the assignment description into Notion blocks
+        :return: A future that resolves to the result of the write
+        """
+        description = assignment.description
+        children = parser.convert(description) if description else None
+        label = f"{assignment.course_name} - {assignment.name}"
+        print(f"Filling in {label}")
+        return writer.submit_children(page_id, children or [], label)
+
+    def sync_assignment(self, assignment, writer: NotionPageWriter, parser, state_index: SyncStateIndex,
+                        database_index: NotionDatabaseIndex | None = None,
+                        deferred_bodies: set[int] | None = None) -> Future[WriteResult] | None:
+        """
+        Queue a write of a single assignment to Notion only if it is new or has changed since it was last synced.
+        New assignments get a new page, changed assignments have their existing page updated and unchanged
+        assignments are skipped. The body of an updated page is replaced if its description changed. If the assignment is missing from the state index but the database index has a page
+        for it, that page is reused instead of creating a duplicate.
+
+        :param assignment: The assignment dictionary to sync
+        :param writer: The writer used to send the request
+        :param parser: The converter used to turn the assignment description into Notion blocks
+        :param state_index: The index of assignments that have already been synced
+        :param database_index: The index of pages that already exist in the Notion database, if any
+        :param deferred_bodies: If given, new pages in lazy description mode are created without their body and the
+        assignment id is added to this set
+        :return: A future that resolves to the result of the write, or None if the assignment is unchanged
+        """
+        stored = state_index.get(assignment.id)
+        if stored is None and database_index is not None:
+            database_index.load_modules([assignment.course_name])
+            existing_page = database_index.find(assignment.html_url)
+            if existing_page is not None:
+                page_id, fingerprint = existing_page
+                if fingerprint == database_index.fingerprint(assignment.name, assignment.due_at,
+                                                              assignment.html_url, assignment.course_name):
+                    state_index.upsert(assignment.id, page_id, assignment.content_hash)
+                    return None
+                # Nothing is known about the body of a page found in the database, so it is replaced
+                return self.update_notion_page(page_id, assignment, writer, parser)
+        if stored is None:
+            if deferred_bodies is not None and self.__defers_body(assignment):
+                deferred_bodies.add(assignment.id)
+                return self.create_notion_page(assignment, writer, None)
+            return self.create_notion_page(assignment, writer, parser)
+
+        page_id, stored_hash = stored
+        if stored_hash == assignment.content_hash:
+            return None
+        # A pending body is filled in from the current description anyway
+        replace_body = state_index.description_hash(assignment.id) != assignment.description_hash and \
+            not state_index.is_body_pending(assignment.id)
+        return self.update_notion_page(page_id, assignment, writer, parser if replace_body else None)
+
+    @staticmethod
+    def __record_write_results(writes: deque[tuple[Assignment, Future[WriteResult]]], state_index: SyncStateIndex,
+                               max_pending: int = 0,
+                               deferred_bodies: set[int] = frozenset()) -> tuple[int, list[WriteResult]]:
+        """
+        Record the results of queued writes in the order they were queued. Successful writes are stored in the state
+        index and failed writes are left out of it so they are retried on the next run. Finished writes are always
+        recorded, and the oldest writes are waited on until no more than max_pending are left.
+
+        :param writes: Tuples of the assignment and the future of its write. Recorded writes are removed
+        :param state_index: The index of assignments that have already been synced
+        :param max_pending: The number of unfinished writes that can be left in the queue
+        :param deferred_bodies: The ids of assignments whose page was created without its body
+        :return: A tuple of the number of writes recorded and the results of the writes that failed
+        """
+        recorded = 0
+        failures = []
+        while writes and (writes[0][1].done() or len(writes) > max_pending):
+            assignment, future = writes.popleft()
+            result = future.result()
+            if result.success:
+                state_index.upsert(assignment.id, result.page_id, assignment.content_hash,
+                                   body_pending=assignment.id in deferred_bodies,
+                                   description_hash=assignment.description_hash)
+            else:
+                failures.append(result)
+            recorded += 1
+        return recorded, failures
+
+    @staticmethod
+    def __record_body_results(writes: deque[tuple[Assignment, Future[WriteResult]]], state_index: SyncStateIndex,
+                              max_pending: int = 0) -> list[WriteResult]:
+        """
+        Record the results of queued page body writes in the order they were queued. A body that was written, even
+        in part, is no longer pending so that it is not appended twice.
+
+        :param writes: Tuples of the assignment and the future of its body write. Recorded writes are removed
+        :param state_index: The index of assignments that have already been synced
+        :param max_pending: The number of unfinished writes that can be left in the queue
+        :return: The results of the writes that failed
+        """
+        failures = []
+        while writes and (writes[0][1].done() or len(writes) > max_pending):
+            assignment, future = writes.popleft()
+            result = future.result()
+            if result.page_id is not None:
+                state_index.clear_body_pending(assignment.id)
+            if not result.success:
+                failures.append(result)
+        return failures
+
+    def __fill_pending_bodies(self, pending: list[Assignment], writer: NotionPageWriter, converter,
+                              state_index: SyncStateIndex, lookahead: int) -> tuple[int, list[WriteResult]]:
+        """
+        Fill in the bodies of pages that were created without them, soonest due first, once every other write of
+        the sync has been sent.
+
+        :param pending: The assignments whose page might still be waiting for its body
+        :param writer: The writer used to send the requests
+        :param converter: The converter used to turn the assignment descriptions into Notion blocks
+        :param state_index: The index of assignments that have already been synced
+        :param lookahead: The number of descriptions converted ahead of the one being written
+        :return: A tuple of the number of bodies written and the results of the writes that failed
+        """
+        # Pages whose creation failed are not in the index, and will be created again by the next run
+        pending = sorted((assignment for assignment in pending if state_index.is_body_pending(assignment.id)),
+                         key=lambda assignment: assignment.due_at or "9999")
+        max_pending_writes = self.__config["max_pending_writes"]
+        writes = deque()
+        failures = []
+        for assignment in pending[:lookahead]:
+            converter.prefetch(assignment.description)
+        for index, assignment in enumerate(pending):
+            if index + lookahead < len(pending):
+                converter.prefetch(pending[index + lookahead].description)
+            page_id = state_index.get(assignment.id)[0]
+            writes.append((assignment, self.fill_page_body(page_id, assignment, writer, converter)))
+            failures.extend(self.__record_body_results(writes, state_index, max_pending_writes))
+        failures.extend(self.__record_body_results(writes, state_index))
+        return len(pending), failures
+
+    def prefetch_descriptions(self, assignments: Iterable[Assignment]) -> None:
+        """
+        Start converting the descriptions of the assignments that the next sync will create a page with a body for,
+        so that they are converted while the rest of the assignments are still being fetched from Canvas.
+
+        :param assignments: The assignments that are about to be synced
+        :return: None
+        """
+        converter = self.__converter
+        if converter is None:
+            if self.__own_converter is None:
+                self.__own_converter = DescriptionConverter(self.__config["conversion_processes"])
+            converter = self.__own_converter
+        state_index = SyncStateIndex(self.__config["state_index_path"])
+        try:
+            for assignment in assignments:
+                if state_index.get(assignment.id) is None and not self.__defers_body(assignment):
+                    converter.prefetch(assignment.description)
+        finally:
+            state_index.close()
+
+    def sync(self, assignments: Iterable[Assignment], lookahead: int | None = None,
+             complete: bool = True) -> list[WriteResult]:
+        """
+        Sync assignments to Notion as they are given. Descriptions of new pages are converted up to lookahead
+        assignments ahead of the one being written, and the number of unfinished writes is bounded, so assignments
+        can be streamed in without the whole list being held in memory. In lazy description mode, new pages that are
+        not due soon are created without their body, and the bodies are filled in once every page has been written.
+
+        :param assignments: The assignments to sync. This may be a lazy iterator
+        :param lookahead: The number of assignments whose descriptions are converted ahead of time. Defaults to the
+        value in the config file
+        :param complete: Whether the assignments are everything Canvas returned for every course, rather than for
+        some of them. Pages still waiting for the body of an assignment missing from a complete sync stop waiting
+        :return: The results of the writes that failed
+        """
+        if lookahead is None:
+            lookahead = self.__config["conversion_lookahead"]
         headers = {
-            "Authorization": os.getenv("NOTION_KEY"),
+            "Authorization": self.__notion_key,
             "Accept": "application/json",
-            "Notion-Version": "2022-02-22",
+            "Notion-Version": self.__config["notion_version"],
             "Content-Type": "application/json"
         }
 
-        parser = CanvasToNotionHTMLParser()
-        for assignment in self.__assignments:
-            self.create_notion_page(assignment, headers, parser)
-        parser.close()
+        state_index = SyncStateIndex(self.__config["state_index_path"])
+        converter = self.__converter or self.__own_converter or \
+            DescriptionConverter(self.__config["conversion_processes"])
+        self.__own_converter = None
+        max_pending_writes = self.__config["max_pending_writes"]
+        lazy = self.__lazy_descriptions["enabled"]
+        upcoming = deque()
+        writes = deque()
+        total_writes = 0
+        failures = []
+        deferred_bodies = set()
+        pending_bodies = []
+        seen_ids = set()
+        filled_bodies = 0
+        body_failures = []
+
+        try:
+            with NotionPageWriter(self.__config["api_base_url"], headers, self.__config["writer"],
+                                  self.__rate_limiter, self.__http_adapter) as writer:
+                database_index = None
+                if self.__config["query_database_for_existing_pages"]:
+                    database_index = NotionDatabaseIndex(writer, self.__config["api_base_url"], self.__DATABASE_ID)
+                    if isinstance(assignments, list):
+                        # Every module is known up front, so they can be loaded in as few queries as possible
+                        database_index.load_modules({assignment.course_name for assignment in assignments
+                                                     if state_index.get(assignment.id) is None})
+
+                def queue_write(assignment):
+                    nonlocal total_writes
+                    future = self.sync_assignment(assignment, writer, converter, state_index, database_index,
+                                                  deferred_bodies if lazy else None)
+                    if future is not None:
+                        writes.append((assignment, future))
+                        total_writes += 1
+                    if assignment.id in deferred_bodies or state_index.is_body_pending(assignment.id):
+                        pending_bodies.append(assignment)
+                    failures.extend(self.__record_write_results(writes, state_index, max_pending_writes,
+                                                                deferred_bodies)[1])
+
+                try:
+                    for assignment in assignments:
+                        seen_ids.add(assignment.id)
+                        # Queue the description of every new page so it is converted in parallel before it is written
+                        if state_index.get(assignment.id) is None and not self.__defers_body(assignment):
+                            converter.prefetch(assignment.description)
+                        upcoming.append(assignment)
+                        if len(upcoming) > lookahead:
+                            queue_write(upcoming.popleft())
+                    while upcoming:
+                        queue_write(upcoming.popleft())
+                finally:
+                    # Record every write that was sent, even if the assignments stopped early, so a rerun skips them
+                    failures.extend(self.__record_write_results(writes, state_index, 0, deferred_bodies)[1])
+
+                print(f"\n{total_writes - len(failures)} of {total_writes} Notion pages written successfully.")
+                if pending_bodies:
+                    # Every page exists by now, so the calendar is usable while the bodies are filled in
+                    filled_bodies, body_failures = self.__fill_pending_bodies(pending_bodies, writer, converter,
+                                                                              state_index, lookahead)
+                if complete:
+                    state_index.clear_stale_body_pending(seen_ids)
+        finally:
+            if converter is not self.__converter:
+                converter.close()
+            state_index.close()
+
+        if filled_bodies:
+            print(f"{filled_bodies - len(body_failures)} of {filled_bodies} page bodies filled in.")
+        for failure in failures + body_failures:
+            print(f"Failed to write {failure.label} (status {failure.status_code}). It will be retried next run.")
+        return failures + body_failures
+
+    def run(self) -> list[WriteResult]:
+        if not self.__assignments:
+            print("No assignment data given. Use NotionAPIInterface.assignments = ... "
+                  "to pass in assignment data before running again.")
+            return []
+        return self.sync(self.__assignments, lookahead=len(self.__assignments))
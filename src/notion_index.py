@@ -0,0 +1,112 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import Any, Iterable
+
+from src.notion_writer import NotionPageWriter
+
+
+class NotionDatabaseIndex:
+    """
+    In-memory index of the pages that already exist in the Notion database, keyed by the Canvas assignment url in
+    their Website property. Pages are loaded one module (course) at a time with paginated database queries, so only
+    the courses that are needed are queried and each is queried once.
+    """
+    # Notion allows at most 100 conditions in a compound filter
+    MAX_FILTER_CONDITIONS = 100
+
+    def __init__(self, writer: NotionPageWriter, api_base_url: str, database_id: str):
+        """
+        :param writer: The writer whose session is used to send the queries
+        :param api_base_url: The base url of the Notion API
+        :param database_id: The id of the Notion database
+        """
+        self.__writer = writer
+        self.__query_url = f"{api_base_url}databases/{database_id}/query"
+        self.__loaded_modules = set()
+        self.__pages = {}
+
+    @staticmethod
+    def __parse_date(date: str | None) -> datetime | str | None:
+        """
+        Parse a date so that the same date written by Canvas and returned by Notion compare equal.
+
+        :param date: An ISO 8601 date or datetime
+        :return: A datetime if the date could be parsed, otherwise the date unchanged
+        """
+        if not date:
+            return None
+        try:
+            return datetime.fromisoformat(date.replace("Z", "+00:00"))
+        except ValueError:
+            return date
+
+    @classmethod
+    def fingerprint(cls, title: str | None, date: str | None, url: str | None,
+                    module: str | None) -> tuple[Any, ...]:
+        """
+        Create a comparable summary of the properties of a page.
+
+        :param title: The title of the page
+        :param date: The date of the page
+        :param url: The Website url of the page
+        :param module: The module select of the page
+        :return: A tuple that is equal for pages with the same properties
+        """
+        return title, cls.__parse_date(date), url, module
+
+    @classmethod
+    def __page_fingerprint(cls, page: dict[str, Any]) -> tuple[Any, ...]:
+        """
+        :param page: A page object returned by Notion
+        :return: The fingerprint of the page's properties
+        """
+        properties = page["properties"]
+        title = "".join(text.get("plain_text") or text.get("text", {}).get("content", "")
+                        for text in properties.get("title", {}).get("title", []))
+        date = (properties.get("date", {}).get("date") or {}).get("start")
+        url = properties.get("Website", {}).get("url")
+        module = (properties.get("module", {}).get("select") or {}).get("name")
+        return cls.fingerprint(title, date, url, module)
+
+    def load_modules(self, module_names: Iterable[str]) -> None:
+        """
+        Query the database for every page in the given modules that have not been loaded yet.
+
+        :param module_names: The names of the modules (courses) to load
+        :return: None
+        """
+        new_modules = sorted(set(module_names) - self.__loaded_modules)
+        for start in range(0, len(new_modules), self.MAX_FILTER_CONDITIONS):
+            modules = new_modules[start:start + self.MAX_FILTER_CONDITIONS]
+            self.__query({"or": [{"property": "module", "select": {"equals": module}} for module in modules]})
+            self.__loaded_modules.update(modules)
+
+    def __query(self, query_filter: dict[str, Any]) -> None:
+        """
+        Run a database query, following its pagination cursor, and add every page found to the index.
+
+        :param query_filter: The filter of the query
+        :return: None
+        """
+        payload = {"filter": query_filter, "page_size": 100}
+        while True:
+            response = self.__writer.request_json("POST", self.__query_url, payload)
+            if response is None:
+                print("Failed to query the Notion database. Existing pages may be duplicated.")
+                return
+            for page in response.get("results", []):
+                fingerprint = self.__page_fingerprint(page)
+                if fingerprint[2] and not page.get("archived"):
+                    self.__pages[fingerprint[2]] = (page["id"], fingerprint)
+            if not response.get("has_more"):
+                return
+            payload["start_cursor"] = response["next_cursor"]
+
+    def find(self, url: str | None) -> tuple[str, tuple[Any, ...]] | None:
+        """
+        Find the existing page of an assignment.
+
+        :param url: The Canvas url of the assignment
+        :return: A tuple of the page id and the page's fingerprint if the page exists, otherwise None
+        """
+        return self.__pages.get(url) if url else None
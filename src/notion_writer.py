@@ -0,0 +1,341 @@
+from __future__ import annotations
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, NamedTuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.instrumentation import metrics
+from src.rate_limiter import TokenBucketRateLimiter
+
+
+class WriteResult(NamedTuple):
+    """
+    The outcome of a single Notion write.
+    """
+    label: str
+    success: bool
+    status_code: int | None
+    page_id: str | None
+    error: str | None
+
+
+class NotionPageWriter:
+    """
+    Sends Notion page writes from a small pool of workers over a single pooled session. Requests are kept within the
+    Notion rate limit, and 429 and 5xx responses are retried with backoff.
+    """
+    MAX_CHILDREN_PER_REQUEST = 100
+    MAX_RICH_TEXT_LENGTH = 2000
+
+    def __init__(self, api_base_url: str, headers: dict[str, str], writer_config: dict[str, int | float],
+                 rate_limiter: TokenBucketRateLimiter | None = None, http_adapter: HTTPAdapter | None = None):
+        """
+        :param api_base_url: The base url of the Notion API
+        :param headers: The headers to send with every request
+        :param writer_config: The writer section of the Notion config file
+        :param rate_limiter: A rate limiter shared with other writers. Defaults to one created from the config
+        :param http_adapter: A connection pool shared with other writers. Defaults to a pool for this writer only
+        """
+        self.__api_base_url = api_base_url
+        self.__max_retries = writer_config["max_retries"]
+        self.__backoff_base = writer_config["backoff_base"]
+        self.__rate_limiter = rate_limiter or TokenBucketRateLimiter(writer_config["requests_per_second"],
+                                                                     max(1, int(writer_config["requests_per_second"])))
+        self.__shared_http_adapter = http_adapter is not None
+        self.__session = self.__create_requests_session(
+            headers, http_adapter or HTTPAdapter(pool_connections=1, pool_maxsize=writer_config["max_workers"])
+        )
+        self.__executor = ThreadPoolExecutor(max_workers=writer_config["max_workers"])
+
+    @staticmethod
+    def __create_requests_session(headers: dict[str, str], http_adapter: HTTPAdapter) -> requests.sessions.Session:
+        """
+        Creates a requests session that sends its requests through a given connection pool.
+
+        :param headers: The headers to send with every request
+        :param http_adapter: The connection pool to use, which should be large enough for every worker
+        :return: Returns a requests session
+        """
+        session = requests.Session()
+        session.headers.update(headers)
+        session.mount("https://", http_adapter)
+        session.mount("http://", http_adapter)
+        return session
+
+    def __backoff_delay(self, attempt: int, response: requests.Response | None = None) -> float:
+        """
+        Work out how long to wait before retrying a request. A Retry-After header is used if one was sent, otherwise
+        the delay grows exponentially with each attempt.
+
+        :param attempt: The number of attempts that have already failed
+        :param response: The failed response, if one was received
+        :return: The number of seconds to wait
+        """
+        if response is not None and response.headers.get("Retry-After"):
+            try:
+                return float(response.headers["Retry-After"])
+            except ValueError:
+                pass
+        return self.__backoff_base * 2 ** attempt
+
+    @staticmethod
+    def __sleep(seconds: float) -> None:
+        """
+        Sleep before retrying a request, recording the time spent.
+
+        :param seconds: The number of seconds to sleep for
+        :return: None
+        """
+        time.sleep(seconds)
+        metrics.record_sleep("notion", seconds)
+
+    def __request(self, method: str, url: str,
+                  payload: dict[str, Any]) -> tuple[int | None, dict[str, Any] | None, str | None]:
+        """
+        Send a request to Notion, retrying on rate limiting, server errors and connection errors.
+
+        :param method: The HTTP method to use
+        :param url: The url to send the request to
+        :param payload: The json body of the request
+        :return: A tuple of the last status code, the json body if the request succeeded and the error if it failed
+        """
+        status_code = None
+        error = None
+        for attempt in range(self.__max_retries + 1):
+            if attempt:
+                metrics.record_retry("notion")
+            metrics.record_sleep("notion", self.__rate_limiter.acquire())
+            start = time.perf_counter()
+            try:
+                response = self.__session.request(method, url, json=payload)
+            except requests.RequestException as exception:
+                metrics.record_request("notion", None, time.perf_counter() - start)
+                error = str(exception)
+                self.__sleep(self.__backoff_delay(attempt))
+                continue
+
+            status_code = response.status_code
+            metrics.record_request("notion", status_code, time.perf_counter() - start)
+            if status_code == 200:
+                return status_code, response.json(), None
+            error = response.text
+            if status_code == 429:
+                # Stop every worker, not just this one, until Notion is ready for more requests
+                self.__rate_limiter.pause(self.__backoff_delay(attempt, response))
+            elif status_code >= 500:
+                self.__sleep(self.__backoff_delay(attempt, response))
+            else:  # Any other error will not be fixed by retrying
+                break
+        return status_code, None, error
+
+    def __send(self, method: str, url: str, payload: dict[str, Any], label: str) -> WriteResult:
+        """
+        Send a write to Notion, retrying on rate limiting, server errors and connection errors.
+
+        :param method: The HTTP method to use
+        :param url: The url to send the request to
+        :param payload: The json body of the request
+        :param label: A human-readable name for the page being written
+        :return: The result of the write
+        """
+        status_code, body, error = self.__request(method, url, payload)
+        if body is None:
+            return WriteResult(label, False, status_code, None, error)
+        return WriteResult(label, True, status_code, body.get("id"), None)
+
+    def request_json(self, method: str, url: str, payload: dict[str, Any]) -> dict[str, Any] | None:
+        """
+        Send a request to Notion in the calling thread and return its response. Useful for reads such as database
+        queries, which share the writer's session, rate limiter and retries.
+
+        :param method: The HTTP method to use
+        :param url: The url to send the request to
+        :param payload: The json body of the request
+        :return: The json body of the response if the request succeeded, otherwise None
+        """
+        return self.__request(method, url, payload)[1]
+
+    @classmethod
+    def split_rich_text(cls, blocks: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Split any rich text in a list of blocks that is longer than Notion allows into several rich text objects.
+        Each piece keeps the annotations and link of the original text. The given blocks are not modified.
+
+        :param blocks: A list of Notion blocks
+        :return: A list of Notion blocks with no rich text over the length limit
+        """
+        limit = cls.MAX_RICH_TEXT_LENGTH
+        split_blocks = []
+        for block in blocks:
+            block_type = block["type"]
+            rich_text_list = block[block_type].get("rich_text", [])
+            if all(len(rich_text["text"]["content"]) <= limit for rich_text in rich_text_list):
+                split_blocks.append(block)
+                continue
+
+            split_rich_text_list = []
+            for rich_text in rich_text_list:
+                content = rich_text["text"]["content"]
+                for start in range(0, max(len(content), 1), limit):
+                    split_rich_text_list.append(
+                        rich_text | {"text": rich_text["text"] | {"content": content[start:start + limit]}}
+                    )
+            split_blocks.append(block | {block_type: block[block_type] | {"rich_text": split_rich_text_list}})
+        return split_blocks
+
+    def __send_page(self, url: str, payload: dict[str, Any], label: str) -> WriteResult:
+        """
+        Create a page with its children sent in batches that Notion accepts. The page is created with the first batch
+        and the rest are appended to it in order. If an append fails, the incomplete page is archived so that the
+        whole page is created again on a later run.
+
+        :param url: The url of the pages endpoint
+        :param payload: The json body of the page, including all of its children
+        :param label: A human-readable name for the page being written
+        :return: The result of the write
+        """
+        children = self.split_rich_text(payload.get("children") or [])
+        batch_size = self.MAX_CHILDREN_PER_REQUEST
+        batches = [children[start:start + batch_size] for start in range(0, len(children), batch_size)]
+
+        page_payload = {key: value for key, value in payload.items() if key != "children"}
+        if batches:
+            page_payload["children"] = batches[0]
+        result = self.__send("POST", url, page_payload, label)
+        if not result.success:
+            return result
+
+        children_url = f"{self.__api_base_url}blocks/{result.page_id}/children"
+        for batch in batches[1:]:
+            append_result = self.__send("PATCH", children_url, {"children": batch}, label)
+            if not append_result.success:
+                self.__send("PATCH", f"{url}/{result.page_id}", {"archived": True}, label)
+                return append_result._replace(page_id=None)
+        return result
+
+    def __append_children(self, page_id: str, children: list[dict[str, Any]], label: str) -> WriteResult:
+        """
+        Append blocks to an existing page in batches that Notion accepts. Notion cannot replace the children of a
+        page, so if a batch after the first fails, the failed result keeps the page id to show that part of the body
+        was written and should not be appended again.
+
+        :param page_id: The id of the page
+        :param children: The blocks to append
+        :param label: A human-readable name for the page being written
+        :return: The result of the last request
+        """
+        children = self.split_rich_text(children)
+        batch_size = self.MAX_CHILDREN_PER_REQUEST
+        children_url = f"{self.__api_base_url}blocks/{page_id}/children"
+        result = WriteResult(label, True, None, page_id, None)
+        for start in range(0, len(children), batch_size):
+            result = self.__send("PATCH", children_url, {"children": children[start:start + batch_size]}, label)
+            if not result.success:
+                return result._replace(page_id=page_id if start else None)
+        return result._replace(page_id=page_id)
+
+    def __update_page(self, url: str, payload: dict[str, Any], page_id: str, children: list[dict[str, Any]] | None,
+                      label: str) -> WriteResult:
+        """
+        Update the properties of a page, then replace its body if new children are given. The body is replaced by
+        deleting every block of the page and appending the new blocks, since Notion cannot replace children in place.
+        Retrying a failed update is safe, since whatever part of the body was written is deleted again.
+
+        :param url: The url of the page
+        :param payload: The json body of the property update
+        :param page_id: The id of the page
+        :param children: The blocks of the new body, or None to leave the body as it is
+        :param label: A human-readable name for the page being written
+        :return: The result of the write
+        """
+        result = self.__send("PATCH", url, payload, label)
+        if not result.success or children is None:
+            return result
+
+        children_url = f"{self.__api_base_url}blocks/{page_id}/children"
+        block_ids = []
+        cursor = None
+        while True:
+            query = f"?page_size={self.MAX_CHILDREN_PER_REQUEST}" + (f"&start_cursor={cursor}" if cursor else "")
+            status_code, body, error = self.__request("GET", children_url + query, None)
+            if body is None:
+                return WriteResult(label, False, status_code, None, error)
+            block_ids.extend(block["id"] for block in body["results"])
+            if not body.get("has_more"):
+                break
+            cursor = body["next_cursor"]
+        for block_id in block_ids:
+            status_code, body, error = self.__request("DELETE", f"{self.__api_base_url}blocks/{block_id}", None)
+            if body is None:
+                return WriteResult(label, False, status_code, None, error)
+        append_result = self.__append_children(page_id, children, label)
+        return append_result if not append_result.success else result
+
+    def submit_page(self, url: str, payload: dict[str, Any], label: str) -> Future[WriteResult]:
+        """
+        Queue the creation of a page by one of the workers. Pages with more children than Notion accepts in one
+        request are created over several requests.
+
+        :param url: The url of the pages endpoint
+        :param payload: The json body of the page, including all of its children
+        :param label: A human-readable name for the page being written
+        :return: A future that resolves to the result of the write
+        """
+        return self.__executor.submit(self.__send_page, url, payload, label)
+
+    def submit_children(self, page_id: str, children: list[dict[str, Any]], label: str) -> Future[WriteResult]:
+        """
+        Queue blocks to be appended to an existing page by one of the workers.
+
+        :param page_id: The id of the page
+        :param children: The blocks to append
+        :param label: A human-readable name for the page being written
+        :return: A future that resolves to the result of the write
+        """
+        return self.__executor.submit(self.__append_children, page_id, children, label)
+
+    def submit_update(self, url: str, payload: dict[str, Any], page_id: str, children: list[dict[str, Any]] | None,
+                      label: str) -> Future[WriteResult]:
+        """
+        Queue an update of a page's properties, and optionally the replacement of its body, by one of the workers.
+
+        :param url: The url of the page
+        :param payload: The json body of the property update
+        :param page_id: The id of the page
+        :param children: The blocks of the new body, or None to leave the body as it is
+        :param label: A human-readable name for the page being written
+        :return: A future that resolves to the result of the write
+        """
+        return self.__executor.submit(self.__update_page, url, payload, page_id, children, label)
+
+    def submit(self, method: str, url: str, payload: dict[str, Any], label: str) -> Future[WriteResult]:
+        """
+        Queue a request to be sent by one of the workers.
+
+        :param method: The HTTP method to use
+        :param url: The url to send the request to
+        :param payload: The json body of the request
+        :param label: A human-readable name for the page being written
+        :return: A future that resolves to the result of the write
+        """
+        return self.__executor.submit(self.__send, method, url, payload, label)
+
+    def close(self) -> None:
+        """
+        Wait for all queued writes to finish and close the session.
+
+        :return: None
+        """
+        self.__executor.shutdown(wait=True)
+        if self.__shared_http_adapter:
+            # Closing the session closes its adapters, which would drop the connections of every other user of them
+            self.__session.adapters.clear()
+        self.__session.close()
+
+    def __enter__(self) -> NotionPageWriter:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
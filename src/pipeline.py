@@ -0,0 +1,103 @@
+from __future__ import annotations
+import queue
+import threading
+from typing import Iterator
+
+from src.assignment import Assignment
+from src.canvas import CanvasAPIInterface
+from src.notion import NotionAPIInterface
+from src.sinks import SinkFanout
+
+# Marks the end of the assignment stream
+_END_OF_STREAM = object()
+# How often a producer blocked on a full queue checks whether the pipeline has stopped, in seconds
+_STOP_CHECK_INTERVAL = 0.1
+
+
+class StreamingPipeline:
+    """
+    Streams assignments from Canvas to Notion through a bounded queue. Canvas assignments are fetched on a background
+    thread while Notion pages are written for the assignments that have already arrived. A SinkFanout can be given in
+    place of Notion to also export the assignments as they arrive.
+    """
+
+    def __init__(self, canvas: CanvasAPIInterface, notion: NotionAPIInterface | SinkFanout, queue_size: int = 100,
+                 mark_sync_complete: bool = True):
+        """
+        :param canvas: The Canvas interface assignments are fetched from
+        :param notion: The Notion interface or sink fanout assignments are written to
+        :param queue_size: The maximum number of assignments waiting to be written
+        :param mark_sync_complete: Whether to mark the Canvas sync as complete once every assignment was written
+        """
+        self.__canvas = canvas
+        self.__notion = notion
+        self.__queue = queue.Queue(maxsize=queue_size)
+        self.__producer_error = None
+        self.__mark_sync_complete = mark_sync_complete
+        self.__stopped = threading.Event()
+
+    def __put(self, item: object) -> bool:
+        """
+        Put an item on the queue, waiting for space until the pipeline is stopped.
+
+        :param item: The item to put on the queue
+        :return: True if the item was put on the queue, or False if the pipeline stopped first
+        """
+        while not self.__stopped.is_set():
+            try:
+                self.__queue.put(item, timeout=_STOP_CHECK_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __produce(self) -> None:
+        """
+        Fetch assignments from Canvas and put them on the queue, followed by the end of stream marker. The fetch is
+        abandoned if the pipeline stops before every assignment has been taken off the queue.
+
+        :return: None
+        """
+        assignments = self.__canvas.stream()
+        try:
+            for assignment in assignments:
+                if not self.__put(assignment):
+                    return
+        except BaseException as error:  # Includes CanvasRequestError, which run raises on the calling thread
+            self.__producer_error = error
+        finally:
+            # Closing the stream closes the Canvas connections and the checkpoint journal
+            assignments.close()
+            self.__put(_END_OF_STREAM)
+
+    def __consume(self) -> Iterator[Assignment]:
+        """
+        Take assignments off the queue until the end of the stream. If the fetch failed, its error is raised once the
+        assignments fetched before it have been taken, so the stream is never mistaken for a complete one.
+
+        :return: An iterator over assignment records
+        """
+        while (assignment := self.__queue.get()) is not _END_OF_STREAM:
+            yield assignment
+        if self.__producer_error is not None:
+            raise self.__producer_error
+
+    def run(self) -> None:
+        """
+        Run the Canvas producer and Notion consumer until every assignment has been written. The Canvas sync is only
+        marked as complete if every assignment was written successfully.
+
+        :return: None
+        """
+        producer = threading.Thread(target=self.__produce, name="canvas-producer", daemon=True)
+        producer.start()
+        try:
+            failures = self.__notion.sync(self.__consume())
+        finally:
+            # Unblocks the producer if the sync raised while the queue was full
+            self.__stopped.set()
+            producer.join()
+        if self.__producer_error is not None:
+            raise self.__producer_error
+        if not failures and self.__mark_sync_complete:
+            self.__canvas.mark_sync_complete()
@@ -0,0 +1,174 @@
+from __future__ import annotations
+import os
+import re
+import json
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+from src.canvas import (COURSES_API_SUFFIX, api_listing_url, assignment_api_suffixes, assignment_groups_api_suffix,
+                        due_date_window_config, response_cache_ttl)
+from src.classification import DueDateWindow
+from src.response_cache import CachedResponse, HTTPResponseCache
+from src.session_cache import CookieSessionCache
+from src.sync_state import CourseSyncTimestamps, SyncStateIndex
+
+
+class SyncPrecheck:
+    """
+    Works out whether a sync could have anything to do, without starting any of the sync machinery. The check passes
+    if the last run finished, no page is waiting for its body, Canvas confirms that every cached listing a sync
+    would revalidate is unchanged and no assignment has moved into or out of the due date window since its course
+    was last synced. The listings are revalidated one after another with conditional requests through urllib, since
+    importing requests alone takes longer than the whole check. This is one request per cached listing page whose
+    ttl has passed, so the check takes a round trip to Canvas per listing rather than a single request.
+    """
+
+    def __init__(self, canvas_config_path: str = "config/canvas.json", notion_config_path: str = "config/notion.json",
+                 access_token: str | None = None):
+        """
+        :param canvas_config_path: The path of the Canvas config file
+        :param notion_config_path: The path of the Notion config file
+        :param access_token: A Canvas personal access token. Defaults to the CANVAS_ACCESS_TOKEN environment variable
+        """
+        with open(canvas_config_path) as cfg:
+            self.__canvas_config = json.load(cfg)
+        with open(notion_config_path) as cfg:
+            self.__notion_config = json.load(cfg)
+        self.__access_token = access_token
+        self.__response_cache = HTTPResponseCache(self.__canvas_config["response_cache"]["path"])
+        self.__window_config = due_date_window_config(self.__canvas_config["due_date_window"],
+                                                      self.__canvas_config["incremental_fetch"])
+
+    def __last_run_finished(self) -> bool:
+        """
+        :return: Whether the last run synced everything it fetched, according to the local state
+        """
+        # The checkpoint journal is only deleted once a run has written every assignment
+        if os.path.exists(self.__canvas_config["checkpoint"]["path"]):
+            return False
+        if not os.path.exists(self.__notion_config["state_index_path"]):
+            return False
+        state_index = SyncStateIndex(self.__notion_config["state_index_path"])
+        try:
+            return not state_index.has_pending_bodies()
+        finally:
+            state_index.close()
+
+    def __auth_headers(self) -> dict[str, str] | None:
+        """
+        :return: The headers that authenticate a request with Canvas, or None if only a browser login would work
+        """
+        from dotenv import load_dotenv
+        load_dotenv()
+
+        access_token = self.__access_token or os.getenv("CANVAS_ACCESS_TOKEN")
+        if access_token:
+            return {"Authorization": f"Bearer {access_token}"}
+        cached_session = CookieSessionCache(self.__canvas_config["session_cache_path"],
+                                            self.__canvas_config["session_cache_max_age"]).load()
+        if not cached_session:
+            return None
+        user_agent, cookies = cached_session
+        return {"User-Agent": user_agent, "Cookie": "; ".join(f"{cookie['name']}={cookie['value']}"
+                                                               for cookie in cookies)}
+
+    def __page_unchanged(self, url: str, cached: CachedResponse, auth_headers: dict[str, str]) -> bool:
+        """
+        Revalidate a cached page with a conditional request.
+
+        :param url: The url of the page
+        :param cached: The cached response of the page
+        :param auth_headers: The headers that authenticate the request
+        :return: Whether Canvas responded that the page has not changed
+        """
+        headers = dict(auth_headers)
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+        if len(headers) == len(auth_headers):
+            return False
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=10):
+                return False
+        except urllib.error.HTTPError as error:
+            return error.code == 304
+        except (urllib.error.URLError, OSError):
+            return False
+
+    def __listing_unchanged(self, api_suffix: str, auth_headers: dict[str, str]) -> tuple[bool, list]:
+        """
+        Check every page of a cached listing the way a sync would: pages younger than their ttl are trusted, and
+        older pages are revalidated.
+
+        :param api_suffix: The suffix appended to the api base url
+        :param auth_headers: The headers that authenticate the requests
+        :return: A tuple of whether the listing is unchanged and its cached items
+        """
+        per_page = self.__canvas_config["api_max_results"]
+        cache_ttl = response_cache_ttl(self.__canvas_config["response_cache"]["ttls"], api_suffix)
+        url = api_listing_url(self.__canvas_config["canvas_url"], api_suffix, per_page)
+        items = []
+        while url:
+            cached = self.__response_cache.get(url)
+            if cached is None:
+                return False, items
+            if time.time() - cached.fetched_at >= cache_ttl and not self.__page_unchanged(url, cached, auth_headers):
+                return False, items
+            items.extend(cached.body)
+            # A new item on a full last page would start a page that is not in the cache
+            if cached.next_url is None and len(cached.body) >= per_page:
+                return False, items
+            url = cached.next_url
+        return True, items
+
+    def __window_unchanged(self, last_synced_at: datetime | None, assignments: list) -> bool:
+        """
+        :param last_synced_at: When the course of the assignments was last synced, if it has been
+        :param assignments: The cached assignment jsons of the course
+        :return: Whether every assignment is in the due date window now exactly when it was at the last sync
+        """
+        if self.__window_config["past_days"] is None and self.__window_config["future_days"] is None:
+            return True
+        if last_synced_at is None:
+            return False
+        window_then = DueDateWindow(self.__window_config, last_synced_at)
+        window_now = DueDateWindow(self.__window_config)
+        return all(window_then.contains(assignment.get("due_at")) == window_now.contains(assignment.get("due_at"))
+                   for assignment in assignments)
+
+    def has_changes(self) -> bool:
+        """
+        :return: True if a sync could have anything to do, or False if it is certain that it would not
+        """
+        canvas_url = self.__canvas_config["canvas_url"]
+        if not canvas_url or not self.__last_run_finished():
+            return True
+        if not canvas_url.endswith("/"):
+            self.__canvas_config["canvas_url"] = f"{canvas_url}/"
+        auth_headers = self.__auth_headers()
+        if auth_headers is None:
+            return True
+
+        unchanged, courses = self.__listing_unchanged(COURSES_API_SUFFIX, auth_headers)
+        if not unchanged:
+            return True
+        course_name_pattern = re.compile(self.__canvas_config["course_name_regex"])
+        incremental_fetch = self.__canvas_config["incremental_fetch"]
+        course_sync_timestamps = CourseSyncTimestamps(incremental_fetch["timestamps_path"])
+        for course in courses:
+            if not course_name_pattern.match(course["course_code"]):
+                continue
+            assignments = []
+            for api_suffix in assignment_api_suffixes(course["id"], incremental_fetch):
+                unchanged, items = self.__listing_unchanged(api_suffix, auth_headers)
+                if not unchanged:
+                    return True
+                assignments.extend(items)
+            if not self.__listing_unchanged(assignment_groups_api_suffix(course["id"]), auth_headers)[0]:
+                return True
+            if not self.__window_unchanged(course_sync_timestamps.get(course["id"]), assignments):
+                return True
+        return False
@@ -0,0 +1,88 @@
+from __future__ import annotations
+import time
+import threading
+from typing import Mapping
+
+
+class TokenBucketRateLimiter:
+    """
+    Thread safe token bucket rate limiter. Tokens are refilled at a constant rate up to a maximum capacity and each
+    request consumes one token. The limiter can also be slowed down by an API reporting how much of its own rate limit
+    is remaining.
+    """
+
+    def __init__(self, rate: float, capacity: int, remaining_header: str | None = None,
+                 low_remaining_threshold: float = 0, low_remaining_backoff: float = 0):
+        """
+        :param rate: The number of tokens added to the bucket per second
+        :param capacity: The maximum number of tokens the bucket can hold
+        :param remaining_header: The response header that reports the remaining API rate limit, if any
+        :param low_remaining_threshold: When the remaining rate limit drops below this value, requests are paused
+        :param low_remaining_backoff: The longest time in seconds requests are paused for when the limit is low
+        """
+        self.__rate = rate
+        self.__capacity = capacity
+        self.__tokens = float(capacity)
+        self.__last_refill = time.monotonic()
+        self.__paused_until = 0.0
+        self.__remaining_header = remaining_header
+        self.__low_remaining_threshold = low_remaining_threshold
+        self.__low_remaining_backoff = low_remaining_backoff
+        self.__lock = threading.Lock()
+
+    def __refill(self, now: float) -> None:
+        """
+        Add the tokens that have accumulated since the last refill. Must be called with the lock held.
+
+        :param now: The current monotonic time
+        :return: None
+        """
+        self.__tokens = min(self.__capacity, self.__tokens + (now - self.__last_refill) * self.__rate)
+        self.__last_refill = now
+
+    def acquire(self) -> float:
+        """
+        Block until a token is available and then consume it.
+
+        :return: The number of seconds spent waiting for the token
+        """
+        waited = 0.0
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__refill(now)
+                if now >= self.__paused_until and self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return waited
+                wait = max(self.__paused_until - now, (1 - self.__tokens) / self.__rate)
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stop handing out tokens for a given amount of time.
+
+        :param seconds: The number of seconds to pause for
+        :return: None
+        """
+        with self.__lock:
+            self.__paused_until = max(self.__paused_until, time.monotonic() + seconds)
+            self.__tokens = 0.0
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """
+        Slow down if the API reports that its rate limit is close to running out. The closer the remaining limit is to
+        zero, the longer requests are paused for.
+
+        :param headers: The headers of the latest response
+        :return: None
+        """
+        if not self.__remaining_header or not self.__low_remaining_threshold:
+            return
+        remaining = headers.get(self.__remaining_header)
+        if remaining is None:
+            return
+        remaining = float(remaining)
+        if remaining < self.__low_remaining_threshold:
+            deficit = 1 - max(remaining, 0) / self.__low_remaining_threshold
+            self.pause(deficit * self.__low_remaining_backoff)
@@ -0,0 +1,81 @@
+from __future__ import annotations
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Any, NamedTuple
+
+
+class CachedResponse(NamedTuple):
+    """
+    A response body stored on disk along with the headers needed to revalidate it.
+    """
+    body: Any
+    next_url: str | None
+    etag: str | None
+    last_modified: str | None
+    fetched_at: float
+
+
+class HTTPResponseCache:
+    """
+    On-disk cache of API responses keyed by url. Each response is stored in its own file so that concurrent requests
+    for different urls never contend for the same file.
+    """
+
+    def __init__(self, cache_dir: str):
+        """
+        :param cache_dir: The directory the cached responses are stored in
+        """
+        self.__cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def __cache_file(self, url: str) -> str:
+        """
+        Get the path of the file a url is cached in.
+
+        :param url: The url of the request
+        :return: The path of the cache file
+        """
+        return os.path.join(self.__cache_dir, f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json")
+
+    def get(self, url: str) -> CachedResponse | None:
+        """
+        Get the cached response for a url.
+
+        :param url: The url of the request
+        :return: The cached response if there is one, otherwise None
+        """
+        try:
+            with open(self.__cache_file(url)) as cache_file:
+                return CachedResponse(**json.load(cache_file))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def put(self, url: str, body: Any, next_url: str | None, etag: str | None, last_modified: str | None) -> None:
+        """
+        Store a response for a url. The file is replaced atomically so a partially written cache entry is never read.
+
+        :param url: The url of the request
+        :param body: The json body of the response
+        :param next_url: The url of the next page of the response, if any
+        :param etag: The ETag header of the response, if any
+        :param last_modified: The Last-Modified header of the response, if any
+        :return: None
+        """
+        cache_file_path = self.__cache_file(url)
+        temporary_path = f"{cache_file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "w") as cache_file:
+            json.dump(CachedResponse(body, next_url, etag, last_modified, time.time())._asdict(), cache_file)
+        os.replace(temporary_path, cache_file_path)
+
+    def touch(self, url: str, cached: CachedResponse) -> None:
+        """
+        Mark a cached response as fresh after the server confirmed it has not changed.
+
+        :param url: The url of the request
+        :param cached: The cached response that was revalidated
+        :return: None
+        """
+        self.put(url, cached.body, cached.next_url, cached.etag, cached.last_modified)
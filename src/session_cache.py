@@ -0,0 +1,65 @@
+from __future__ import annotations
+import os
+import json
+import time
+from typing import Any
+
+
+class CookieSessionCache:
+    """
+    Persists the cookies of a logged-in Canvas browser session to disk so later runs can reuse them instead of
+    logging in again. Cached cookies are discarded once any of them expire or the cache is older than a maximum age.
+    """
+
+    def __init__(self, cache_path: str, max_age: float):
+        """
+        :param cache_path: The file the cookies are stored in
+        :param max_age: The longest time in seconds a cached session is trusted for, used for cookies with no expiry
+        """
+        self.__cache_path = cache_path
+        self.__max_age = max_age
+
+    def load(self) -> tuple[str, list[dict[str, Any]]] | None:
+        """
+        Load the cached session if one exists and has not expired.
+
+        :return: A tuple of the user agent and the cookies if a valid session is cached, otherwise None
+        """
+        try:
+            with open(self.__cache_path) as cache_file:
+                cached = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+        now = time.time()
+        if now - cached["saved_at"] > self.__max_age:
+            return None
+        if any(cookie.get("expiry") is not None and cookie["expiry"] <= now for cookie in cached["cookies"]):
+            return None
+        return cached["user_agent"], cached["cookies"]
+
+    def save(self, user_agent: str, cookies: list[dict[str, Any]]) -> None:
+        """
+        Save a session to the cache. The file is only readable by the current user since it contains login cookies.
+
+        :param user_agent: The user agent of the browser the cookies came from
+        :param cookies: The cookies in the format returned by Selenium
+        :return: None
+        """
+        directory = os.path.dirname(self.__cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        file_descriptor = os.open(self.__cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(file_descriptor, "w") as cache_file:
+            json.dump({"saved_at": time.time(), "user_agent": user_agent, "cookies": cookies}, cache_file)
+
+    def clear(self) -> None:
+        """
+        Delete the cached session.
+
+        :return: None
+        """
+        try:
+            os.remove(self.__cache_path)
+        except FileNotFoundError:
+            pass
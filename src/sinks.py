@@ -0,0 +1,239 @@
+from __future__ import annotations
+import json
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime, timezone
+from typing import IO, Iterable, Iterator
+from urllib.parse import urlparse
+
+from src.assignment import Assignment
+from src.notion import NotionAPIInterface
+from src.notion_writer import WriteResult
+
+
+class AssignmentSink(ABC):
+    """
+    A destination assignments are exported to in one buffered pass. The export is written to a temporary file next to
+    the destination, which only replaces the destination once every assignment has been written.
+    """
+    BUFFER_SIZE = 1 << 20
+
+    def __init__(self, path: str):
+        """
+        :param path: The file the assignments are exported to
+        """
+        self.__path = path
+        self.__file: IO[str] | None = None
+        self.__temp_path = None
+
+    def open(self) -> None:
+        """
+        Open the temporary file the export is written to and write the header of the export.
+
+        :return: None
+        """
+        directory = os.path.dirname(os.path.abspath(self.__path))
+        os.makedirs(directory, exist_ok=True)
+        descriptor, self.__temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        self.__file = os.fdopen(descriptor, "w", encoding="utf-8", newline="", buffering=self.BUFFER_SIZE)
+        self._write_header(self.__file)
+
+    def write(self, assignment: Assignment) -> None:
+        """
+        :param assignment: The assignment to export
+        :return: None
+        """
+        self._write_assignment(self.__file, assignment)
+
+    def close(self) -> None:
+        """
+        Write the footer of the export and move it to the destination.
+
+        :return: None
+        """
+        self._write_footer(self.__file)
+        self.__file.close()
+        os.replace(self.__temp_path, self.__path)
+        self.__file = self.__temp_path = None
+
+    def abort(self) -> None:
+        """
+        Discard the export, leaving the destination untouched.
+
+        :return: None
+        """
+        if self.__file is not None:
+            self.__file.close()
+            os.remove(self.__temp_path)
+            self.__file = self.__temp_path = None
+
+    def _write_header(self, file: IO[str]) -> None:
+        pass
+
+    @abstractmethod
+    def _write_assignment(self, file: IO[str], assignment: Assignment) -> None:
+        pass
+
+    def _write_footer(self, file: IO[str]) -> None:
+        pass
+
+
+class JSONLinesSink(AssignmentSink):
+    """
+    Exports assignments as JSON Lines, one json object per assignment.
+    """
+
+    def _write_assignment(self, file: IO[str], assignment: Assignment) -> None:
+        file.write(json.dumps(assignment.as_dict(), ensure_ascii=False))
+        file.write("\n")
+
+
+class ICSCalendarSink(AssignmentSink):
+    """
+    Exports assignments with a due date as events of an iCalendar (RFC 5545) file, which can be imported into or
+    subscribed to by calendar clients.
+    """
+    MAX_LINE_OCTETS = 75
+
+    def __init__(self, path: str, canvas_url: str = "canvas"):
+        """
+        :param path: The file the calendar is exported to
+        :param canvas_url: The URL of the Canvas instance, used to make event UIDs globally unique
+        """
+        super().__init__(path)
+        self.__uid_domain = urlparse(canvas_url).hostname or "canvas"
+        self.__timestamp = None
+
+    @staticmethod
+    def __escape(text: str) -> str:
+        return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+    @staticmethod
+    def __format_time(timestamp: str) -> str:
+        parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+        return parsed.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+    @classmethod
+    def __fold(cls, line: str) -> Iterator[str]:
+        """
+        Split a content line into lines of at most 75 octets, every line after the first starting with a space.
+
+        :param line: The content line to fold
+        :return: An iterator over the folded lines
+        """
+        limit = cls.MAX_LINE_OCTETS
+        current = []
+        size = 0
+        for character in line:
+            character_size = len(character.encode("utf-8"))
+            if size + character_size > limit:
+                yield "".join(current)
+                current = [" "]
+                size = 1
+            current.append(character)
+            size += character_size
+        yield "".join(current)
+
+    def __write_line(self, file: IO[str], line: str) -> None:
+        for folded in self.__fold(line):
+            file.write(folded)
+            file.write("\r\n")
+
+    def _write_header(self, file: IO[str]) -> None:
+        self.__timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        for line in ("BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//canvas-notion-calendar//EN", "CALSCALE:GREGORIAN",
+                     "METHOD:PUBLISH"):
+            self.__write_line(file, line)
+
+    def _write_assignment(self, file: IO[str], assignment: Assignment) -> None:
+        # Events need a start time, so assignments without a due date are left out of the calendar
+        if not assignment.due_at:
+            return
+        due_at = self.__format_time(assignment.due_at)
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:assignment-{assignment.id}@{self.__uid_domain}",
+            f"DTSTAMP:{self.__timestamp}",
+            f"DTSTART:{due_at}",
+            f"DTEND:{due_at}",
+            f"SUMMARY:{self.__escape(f'{assignment.course_name}: {assignment.name}')}",
+            f"CATEGORIES:{self.__escape(assignment.course_name)},{self.__escape(assignment.category)}",
+        ]
+        if assignment.html_url:
+            lines.append(f"URL:{assignment.html_url}")
+        if assignment.unlock_at:
+            lines.append(f"DESCRIPTION:{self.__escape(f'Available from {assignment.unlock_at}')}")
+        lines.append("END:VEVENT")
+        for line in lines:
+            self.__write_line(file, line)
+
+    def _write_footer(self, file: IO[str]) -> None:
+        self.__write_line(file, "END:VCALENDAR")
+
+
+class SinkFanout:
+    """
+    Feeds the assignments of a single Canvas fetch to Notion and every export sink, so Canvas is only scraped once no
+    matter how many destinations there are. It has the same sync method as NotionAPIInterface, so it can be used
+    anywhere Notion is.
+    """
+
+    def __init__(self, notion: NotionAPIInterface | None, sinks: list[AssignmentSink]):
+        """
+        :param notion: The Notion interface to sync assignments to. If this is None, assignments are only exported
+        :param sinks: The sinks to export assignments to
+        """
+        self.__notion = notion
+        self.__sinks = sinks
+
+    def __tee(self, assignments: Iterable[Assignment]) -> Iterator[Assignment]:
+        """
+        Export every assignment to the sinks as it is passed on.
+
+        :param assignments: The assignments to export
+        :return: An iterator over the same assignments
+        """
+        for assignment in assignments:
+            for sink in self.__sinks:
+                sink.write(assignment)
+            yield assignment
+
+    def prefetch_descriptions(self, assignments: Iterable[Assignment]) -> None:
+        """
+        :param assignments: The assignments that are about to be synced. Passed on to
+        NotionAPIInterface.prefetch_descriptions
+        :return: None
+        """
+        if self.__notion is not None:
+            self.__notion.prefetch_descriptions(assignments)
+
+    def sync(self, assignments: Iterable[Assignment], lookahead: int | None = None) -> list[WriteResult]:
+        """
+        Export the assignments to every sink and sync them to Notion. The exports only replace their destinations if
+        every assignment was read without an error.
+
+        :param assignments: The assignments to sync. This may be a lazy iterator
+        :param lookahead: Passed on to NotionAPIInterface.sync
+        :return: The results of the Notion writes that failed
+        """
+        for sink in self.__sinks:
+            sink.open()
+        try:
+            if isinstance(assignments, list):
+                # The whole list is already in memory, so it is exported first and Notion still gets to see the list
+                deque(self.__tee(assignments), maxlen=0)
+                failures = self.__notion.sync(assignments, lookahead) if self.__notion is not None else []
+            elif self.__notion is not None:
+                failures = self.__notion.sync(self.__tee(assignments), lookahead)
+            else:
+                deque(self.__tee(assignments), maxlen=0)
+                failures = []
+        except BaseException:
+            for sink in self.__sinks:
+                sink.abort()
+            raise
+        for sink in self.__sinks:
+            sink.close()
+        return failures
@@ -0,0 +1,331 @@
+from __future__ import annotations
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any
+
+
+class SyncStateIndex:
+    """
+    Persistent index of assignments that have already been pushed to Notion. Each Canvas assignment id is mapped to
+    the id of its Notion page and a hash of the assignment content at the time it was last written, along with a
+    hash of the description its page body was written from. Pages created without their description are flagged
+    until their body has been filled in.
+    """
+
+    def __init__(self, db_path: str):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.__connection = sqlite3.connect(db_path)
+        self.__connection.execute(
+            "CREATE TABLE IF NOT EXISTS assignments ("
+            "assignment_id INTEGER PRIMARY KEY, "
+            "page_id TEXT NOT NULL, "
+            "content_hash TEXT NOT NULL)"
+        )
+        columns = {row[1] for row in self.__connection.execute("PRAGMA table_info(assignments)")}
+        if "body_pending" not in columns:  # Indexes created before lazy descriptions were added
+            self.__connection.execute(
+                "ALTER TABLE assignments ADD COLUMN body_pending INTEGER NOT NULL DEFAULT 0"
+            )
+        if "description_hash" not in columns:  # Indexes created before page bodies were refreshed
+            self.__connection.execute("ALTER TABLE assignments ADD COLUMN description_hash TEXT")
+        self.__connection.commit()
+
+    @staticmethod
+    def content_hash(assignment: dict[str, Any]) -> str:
+        """
+        Create a stable hash of an assignment's content. Key order does not affect the hash.
+
+        :param assignment: An assignment dictionary
+        :return: A hex digest of the assignment content
+        """
+        serialised = json.dumps(assignment, sort_keys=True, default=str)
+        return hashlib.sha256(serialised.encode("utf-8")).hexdigest()
+
+    def get(self, assignment_id: int) -> tuple[str, str] | None:
+        """
+        Look up the stored Notion page id and content hash for an assignment.
+
+        :param assignment_id: The Canvas assignment id
+        :return: A tuple of (page id, content hash) if the assignment has been synced before, otherwise None
+        """
+        row = self.__connection.execute(
+            "SELECT page_id, content_hash FROM assignments WHERE assignment_id = ?", (assignment_id,)
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def upsert(self, assignment_id: int, page_id: str, content_hash: str, body_pending: bool = False,
+               description_hash: str | None = None) -> None:
+        """
+        Record that an assignment has been written to a Notion page. A pending body stays pending until
+        clear_body_pending is called, even if the assignment is written again.
+
+        :param assignment_id: The Canvas assignment id
+        :param page_id: The id of the Notion page the assignment was written to
+        :param content_hash: The content hash of the assignment that was written
+        :param body_pending: Whether the page was created without its body
+        :param description_hash: The hash of the description the page body was or will be written from, or None if
+        it is not known
+        :return: None
+        """
+        self.__connection.execute(
+            "INSERT INTO assignments (assignment_id, page_id, content_hash, body_pending, description_hash) "
+            "VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(assignment_id) DO UPDATE SET page_id = excluded.page_id, "
+            "content_hash = excluded.content_hash, body_pending = MAX(body_pending, excluded.body_pending), "
+            "description_hash = excluded.description_hash",
+            (assignment_id, page_id, content_hash, int(body_pending), description_hash),
+        )
+        self.__connection.commit()
+
+    def description_hash(self, assignment_id: int) -> str | None:
+        """
+        :param assignment_id: The Canvas assignment id
+        :return: The hash of the description the page body was written from, or None if it is not known
+        """
+        row = self.__connection.execute(
+            "SELECT description_hash FROM assignments WHERE assignment_id = ?", (assignment_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def is_body_pending(self, assignment_id: int) -> bool:
+        """
+        :param assignment_id: The Canvas assignment id
+        :return: Whether the page of the assignment was created without its body and is still waiting for it
+        """
+        row = self.__connection.execute(
+            "SELECT body_pending FROM assignments WHERE assignment_id = ?", (assignment_id,)
+        ).fetchone()
+        return bool(row and row[0])
+
+    def has_pending_bodies(self) -> bool:
+        """
+        :return: Whether any page is still waiting for its body
+        """
+        row = self.__connection.execute("SELECT 1 FROM assignments WHERE body_pending = 1 LIMIT 1").fetchone()
+        return row is not None
+
+    def clear_body_pending(self, assignment_id: int) -> None:
+        """
+        Record that the body of an assignment's page has been filled in.
+
+        :param assignment_id: The Canvas assignment id
+        :return: None
+        """
+        self.__connection.execute("UPDATE assignments SET body_pending = 0 WHERE assignment_id = ?", (assignment_id,))
+        self.__connection.commit()
+
+    def clear_stale_body_pending(self, seen_ids: set[int]) -> int:
+        """
+        Stop waiting for the bodies of pages whose assignment was not seen by a sync of every course, for example
+        because it was deleted or is no longer due within the window. Their bodies could never be filled in.
+
+        :param seen_ids: The Canvas ids of every assignment the sync saw
+        :return: The number of pages that are no longer waiting for their body
+        """
+        pending = self.__connection.execute("SELECT assignment_id FROM assignments WHERE body_pending = 1").fetchall()
+        stale = [row for row in pending if row[0] not in seen_ids]
+        self.__connection.executemany("UPDATE assignments SET body_pending = 0 WHERE assignment_id = ?", stale)
+        self.__connection.commit()
+        return len(stale)
+
+    def close(self) -> None:
+        """
+        Close the connection to the index database.
+
+        :return: None
+        """
+        self.__connection.close()
+
+
+class CourseSyncTimestamps:
+    """
+    Records when each Canvas course was last synced successfully, so later runs only need the assignments that have
+    been updated since. The timestamps are stored in a json file.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: The file the timestamps are stored in
+        """
+        self.__path = path
+        try:
+            with open(path) as timestamps_file:
+                self.__timestamps = {int(course_id): datetime.fromisoformat(timestamp)
+                                     for course_id, timestamp in json.load(timestamps_file).items()}
+        except (OSError, ValueError):
+            self.__timestamps = {}
+
+    def get(self, course_id: int) -> datetime | None:
+        """
+        :param course_id: The Canvas course id
+        :return: When the course was last synced successfully, or None if it has never been synced
+        """
+        return self.__timestamps.get(course_id)
+
+    def save(self, course_ids: set[int], synced_at: datetime) -> None:
+        """
+        Record that a set of courses were synced successfully and write the timestamps to disk.
+
+        :param course_ids: The ids of the courses that were synced
+        :param synced_at: When the sync started
+        :return: None
+        """
+        self.__timestamps |= {course_id: synced_at for course_id in course_ids}
+        directory = os.path.dirname(self.__path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.__path, "w") as timestamps_file:
+            json.dump({str(course_id): timestamp.isoformat() for course_id, timestamp in self.__timestamps.items()},
+                      timestamps_file)
+
+
+class FetchCheckpoint:
+    """
+    Journal of the Canvas courses whose assignments have been fetched by a run that has not finished syncing yet. If
+    the fetch stops early, the next run resumes from the journal instead of fetching those courses again. Each line of
+    the journal is a json object, and a course is only resumed once the line marking it complete has been written.
+    Once the fetch has finished the journal is marked as such and is never resumed from, so a run whose writes failed
+    fetches fresh data next time. The journal itself is kept until the run has synced every assignment.
+    """
+
+    def __init__(self, path: str, max_age: float):
+        """
+        :param path: The file the journal is stored in
+        :param max_age: The number of seconds after the start of a run that its journal can be resumed from
+        """
+        self.__path = path
+        self.__max_age = max_age
+        self.__file = None
+        self.__lock = threading.Lock()
+        self.__started_at = None
+
+    @property
+    def started_at(self) -> datetime | None:
+        """
+        :return: When the fetch the open journal belongs to started, which is the start of an earlier run if the
+        journal was resumed. None if no journal has been opened
+        """
+        return self.__started_at
+
+    def __load(self) -> tuple[datetime, dict[int, list[tuple[str, dict[str, Any]]]]] | None:
+        """
+        Read the completed courses from the journal of an earlier run.
+
+        :return: A tuple of when the earlier run started, and a dictionary with the course id as the key and a list of
+        tuples of the assignment type and the assignment json as the value. None if there is no unfinished journal
+        recent enough to resume from
+        """
+        try:
+            with open(self.__path) as journal:
+                header = json.loads(journal.readline())
+                started_at = datetime.fromisoformat(header["started_at"])
+                if (datetime.now(timezone.utc) - started_at).total_seconds() > self.__max_age:
+                    return None
+                assignments = defaultdict(list)
+                completed = set()
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:  # The last line is cut short if the run was killed while writing it
+                        continue
+                    if "fetch_finished" in entry:
+                        return None
+                    if "completed_course" in entry:
+                        completed.add(entry["completed_course"])
+                    else:
+                        assignments[entry["course"]].append((entry["assignment_type"], entry["assignment"]))
+        except (OSError, ValueError, KeyError):
+            return None
+        return started_at, {course_id: assignments[course_id] for course_id in completed}
+
+    def open(self) -> dict[int, list[tuple[str, dict[str, Any]]]]:
+        """
+        Open the journal for a new run. The journal of an earlier run is continued if it is recent enough, otherwise
+        a new journal is started.
+
+        :return: The completed courses of the earlier run, see __load
+        """
+        loaded = self.__load()
+        directory = os.path.dirname(self.__path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if loaded is None:
+            self.__started_at = datetime.now(timezone.utc)
+            completed = {}
+            self.__file = open(self.__path, "w")
+            self.__file.write(json.dumps({"started_at": self.__started_at.isoformat()}) + "\n")
+        else:
+            self.__started_at, completed = loaded
+            self.__file = open(self.__path, "a")
+        return completed
+
+    def record_assignment(self, course_id: int, assignment_type: str, assignment: dict[str, Any]) -> None:
+        """
+        Add a fetched assignment to the journal. It is only resumed once its course has been completed.
+
+        :param course_id: The id of the course the assignment belongs to
+        :param assignment_type: The name of the assignment group the assignment belongs to
+        :param assignment: The relevant keys of the Canvas assignment json
+        :return: None
+        """
+        if self.__file is None:
+            return
+        line = json.dumps({"course": course_id, "assignment_type": assignment_type, "assignment": assignment})
+        with self.__lock:
+            self.__file.write(line + "\n")
+
+    def complete_course(self, course_id: int) -> None:
+        """
+        Mark every assignment of a course as fetched and make sure the journal is on disk.
+
+        :param course_id: The id of the completed course
+        :return: None
+        """
+        if self.__file is None:
+            return
+        with self.__lock:
+            self.__file.write(json.dumps({"completed_course": course_id}) + "\n")
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+
+    def finish(self) -> None:
+        """
+        Mark the fetch as finished and close the journal, so that the next run fetches everything again.
+
+        :return: None
+        """
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.write(json.dumps({"fetch_finished": True}) + "\n")
+                self.__file.close()
+                self.__file = None
+
+    def close(self) -> None:
+        """
+        Close the journal, keeping it so that the next run can resume from it.
+
+        :return: None
+        """
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+
+    def clear(self) -> None:
+        """
+        Close and delete the journal once the run it belongs to has finished syncing.
+
+        :return: None
+        """
+        self.close()
+        try:
+            os.remove(self.__path)
+        except FileNotFoundError:
+            pass
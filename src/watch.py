@@ -0,0 +1,182 @@
+from __future__ import annotations
+import time
+from datetime import datetime, timezone
+
+from src.assignment import Assignment
+from src.canvas import CanvasAPIInterface, CanvasRequestError
+from src.instrumentation import metrics
+from src.notion import NotionAPIInterface
+
+
+class AdaptivePollScheduler:
+    """
+    Decides when each course should next be polled. Courses with an assignment due or unlocking soon are polled
+    often, and courses with nothing coming up are polled rarely.
+    """
+
+    def __init__(self, watch_config: dict[str, float]):
+        """
+        :param watch_config: The watch section of the Canvas config file
+        """
+        self.__min_interval = watch_config["min_poll_interval"]
+        self.__max_interval = watch_config["max_poll_interval"]
+        self.__near_event_window = watch_config["near_event_window"]
+        self.__interval_fraction = watch_config["interval_fraction"]
+        self.__event_times = {}
+        self.__next_polls = {}
+
+    @staticmethod
+    def __parse_timestamp(timestamp: str) -> float:
+        """
+        Parse a Canvas ISO 8601 timestamp.
+
+        :param timestamp: A timestamp such as "2022-07-01T11:59:00Z"
+        :return: The timestamp in seconds since the epoch
+        """
+        return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+
+    def update(self, course_name: str, assignments: list[Assignment]) -> None:
+        """
+        Remember the due and unlock dates of the assignments of a course that were just fetched. Assignments that
+        were not fetched keep the dates from earlier polls, so this works with incremental fetching.
+
+        :param course_name: The name of the course
+        :param assignments: The assignments fetched for the course
+        :return: None
+        """
+        event_times = self.__event_times.setdefault(course_name, {})
+        for assignment in assignments:
+            event_times[assignment.id] = [self.__parse_timestamp(timestamp)
+                                          for timestamp in (assignment.due_at, assignment.unlock_at) if timestamp]
+
+    def poll_interval(self, course_name: str, now: float) -> float:
+        """
+        Work out how long to wait before polling a course again. The interval is the minimum while an event is
+        within the near event window, and otherwise grows with the time until the next event.
+
+        :param course_name: The name of the course
+        :param now: The current time in seconds since the epoch
+        :return: The number of seconds until the course should be polled again
+        """
+        upcoming = [event_time - now for times in self.__event_times.get(course_name, {}).values()
+                    for event_time in times if event_time > now]
+        if not upcoming:
+            return self.__max_interval
+        time_until_next_event = min(upcoming)
+        if time_until_next_event <= self.__near_event_window:
+            return self.__min_interval
+        return min(self.__max_interval, max(self.__min_interval, time_until_next_event * self.__interval_fraction))
+
+    def schedule(self, course_name: str, now: float) -> None:
+        """
+        :param course_name: The name of the course that was just polled
+        :param now: The current time in seconds since the epoch
+        :return: None
+        """
+        self.__next_polls[course_name] = now + self.poll_interval(course_name, now)
+
+    def due_courses(self, course_names: list[str], now: float) -> list[str]:
+        """
+        :param course_names: The names of every course being watched
+        :param now: The current time in seconds since the epoch
+        :return: The names of the courses that are due to be polled. Courses that have never been polled are always due
+        """
+        return [name for name in course_names if self.__next_polls.get(name, 0) <= now]
+
+    def next_poll_time(self, course_names: list[str]) -> float:
+        """
+        :param course_names: The names of every course being watched
+        :return: The earliest time any of the courses is due to be polled, in seconds since the epoch
+        """
+        return min((self.__next_polls.get(name, 0) for name in course_names), default=0)
+
+
+class WatchRunner:
+    """
+    Keeps one authenticated Canvas session open and repeatedly syncs courses into Notion on an adaptive schedule.
+    Only assignments that are new or have changed are written to Notion.
+    """
+
+    def __init__(self, canvas: CanvasAPIInterface, notion: NotionAPIInterface, watch_config: dict[str, float]):
+        """
+        :param canvas: The Canvas interface assignments are fetched from
+        :param notion: The Notion interface assignments are written to
+        :param watch_config: The watch section of the Canvas config file
+        """
+        self.__canvas = canvas
+        self.__notion = notion
+        self.__course_refresh_interval = watch_config["course_refresh_interval"]
+        self.__min_poll_interval = watch_config["min_poll_interval"]
+        self.__scheduler = AdaptivePollScheduler(watch_config)
+        self.__courses = []
+        self.__next_course_refresh = 0
+
+    def __refresh_courses(self, now: float) -> None:
+        """
+        Refresh the list of enrolled courses if it has not been refreshed recently. If Canvas cannot be reached, the
+        courses from the last refresh are kept and the refresh is tried again after the minimum poll interval.
+
+        :param now: The current time in seconds since the epoch
+        :return: None
+        """
+        if now < self.__next_course_refresh:
+            return
+        try:
+            self.__courses = self.__canvas.get_courses()
+        except CanvasRequestError:
+            self.__next_course_refresh = now + self.__min_poll_interval
+            return
+        self.__next_course_refresh = now + self.__course_refresh_interval
+
+    def poll(self) -> None:
+        """
+        Sync every course that is due to be polled and schedule its next poll.
+
+        :return: None
+        """
+        now = time.time()
+        self.__refresh_courses(now)
+        course_names = [course["course_code"] for course in self.__courses]
+        due_names = set(self.__scheduler.due_courses(course_names, now))
+        if not due_names:
+            return
+
+        print(f"[{datetime.now(timezone.utc):%Y-%m-%d %H:%M:%S}] Polling {', '.join(sorted(due_names))}")
+        with metrics.stage("watch_poll"):
+            try:
+                assignments = self.__canvas.fetch_assignments(
+                    [course for course in self.__courses if course["course_code"] in due_names]
+                )
+            except CanvasRequestError:
+                # Try again at the next scheduled poll rather than stopping watch mode
+                for course_name in due_names:
+                    self.__scheduler.schedule(course_name, now)
+                return
+            # Only some courses were fetched, so pages of the other courses keep waiting for their bodies
+            failures = self.__notion.sync(assignments, complete=False) if assignments else []
+        if not failures:
+            self.__canvas.mark_sync_complete()
+
+        for course_name in due_names:
+            self.__scheduler.update(course_name, [assignment for assignment in assignments
+                                                  if assignment.course_name == course_name])
+            self.__scheduler.schedule(course_name, now)
+
+    def run(self) -> None:
+        """
+        Poll forever, sleeping until the next course is due. Stops on a keyboard interrupt.
+
+        :return: None
+        """
+        try:
+            while True:
+                self.poll()
+                course_names = [course["course_code"] for course in self.__courses]
+                wake_time = self.__next_course_refresh
+                if course_names:
+                    wake_time = min(self.__scheduler.next_poll_time(course_names), wake_time)
+                time.sleep(max(1.0, wake_time - time.time()))
+        except KeyboardInterrupt:
+            print("\nStopping watch mode.")
+        finally:
+            self.__canvas.close()